@@ -0,0 +1,200 @@
+import json
+import os
+import sys
+from argparse import ArgumentParser, SUPPRESS
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+# NDN Imports
+from ndn.encoding import Name
+# Custom Imports
+sys.path.insert(0,'.')
+from record import Record
+from record_storage import RecordStorage
+
+def parse_cmd_args() -> dict:
+    # Command Line Parser
+    parser = ArgumentParser(add_help=False,description="Check every record in a logger's record store for tampering.")
+    requiredArgs = parser.add_argument_group("required arguments")
+    optionalArgs = parser.add_argument_group("optional arguments")
+    informationArgs = parser.add_argument_group("information arguments")
+    # Adding all Command Line Arguments
+    requiredArgs.add_argument("--store-path",action="store",dest="store_path",required=True,help="record store file name, e.g. record_store_a")
+    optionalArgs.add_argument("-s","--store",action="store",dest="store",default="dbm",choices=["dbm","sqlite","segment"],required=False,help="record store backend (default: dbm)")
+    optionalArgs.add_argument("-w","--workers",action="store",dest="workers",type=int,default=None,required=False,help="worker processes hashing records (default: one per core)")
+    optionalArgs.add_argument("--batch-size",action="store",dest="batch_size",type=int,default=1000,required=False,help="records sent to a worker at a time (default: 1000)")
+    optionalArgs.add_argument("--json",action="store",dest="json",default=None,required=False,help="also write the full report to this file as JSON")
+    informationArgs.add_argument("-h","--help",action="help",default=SUPPRESS,help="show this help message and exit")
+    # Getting all Arguments
+    argvars = parser.parse_args()
+    args = {}
+    args["store_path"] = argvars.store_path
+    args["store"] = argvars.store
+    args["workers"] = argvars.workers
+    args["batch_size"] = argvars.batch_size
+    args["json"] = argvars.json
+    return args
+
+# What the audit needs to know about one record.
+# (record hash, pointer names, pointer hashes, is genesis record), or None if it can't be decoded.
+RecordSummary = Optional[Tuple[str, Tuple[str, ...], Tuple[str, ...], bool]]
+
+# Decode and hash a batch of encoded records. Runs in a worker process.
+def summarize_records(batch: List[Tuple[str, bytes]]) -> List[Tuple[str, RecordSummary]]:
+    summaries = []
+    for record_name, encoded_record in batch:
+        try:
+            record = Record(data=encoded_record)
+            summaries.append((record_name, (
+                record.get_record_hash(),
+                tuple(Name.to_str(ptr) for ptr in record.get_pointers_from_header()),
+                tuple(record.get_pointer_hashes_from_header()),
+                record.is_genesis_record())))
+        except Exception:
+            summaries.append((record_name, None))
+    return summaries
+
+def batched(records: Iterator[Tuple[str, bytes]], batch_size: int) -> Iterator[List[Tuple[str, bytes]]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if (len(batch) >= batch_size):
+            yield batch
+            batch = []
+    if (batch):
+        yield batch
+
+class AuditReport:
+    def __init__(self) -> None:
+        self.num_records: int = 0
+        # Records that couldn't be decoded.
+        self.malformed: List[str] = []
+        # Non-genesis records with no pointers.
+        self.unlinked: List[str] = []
+        # (record, parent, hash in record, parent's actual hash)
+        self.broken_links: List[Tuple[str, str, str, str]] = []
+        # (record, missing parent)
+        self.orphans: List[Tuple[str, str]] = []
+        # Records that can't be traced back to the genesis records through intact links.
+        self.unreachable: List[str] = []
+        # All decoded records, each after the records it points to.
+        self.order: List[str] = []
+
+    def is_clean(self) -> bool:
+        return not (self.malformed or self.unlinked or self.broken_links
+                    or self.orphans or self.unreachable)
+
+    def to_dict(self) -> dict:
+        return {
+            'records': self.num_records,
+            'malformed': self.malformed,
+            'unlinked': self.unlinked,
+            'broken_links': [
+                {'record': r, 'parent': p, 'expected_hash': e, 'actual_hash': a}
+                for r, p, e, a in self.broken_links],
+            'orphans': [{'record': r, 'missing_parent': p} for r, p in self.orphans],
+            'unreachable': self.unreachable,
+        }
+
+    def print(self) -> None:
+        print(f'records:      {self.num_records}')
+        print(f'malformed:    {len(self.malformed)}')
+        print(f'unlinked:     {len(self.unlinked)}')
+        print(f'broken links: {len(self.broken_links)}')
+        for record_name, parent, expected, actual in self.broken_links:
+            print(f'  {record_name} -> {parent}: expected {expected}, got {actual}')
+        print(f'orphans:      {len(self.orphans)}')
+        for record_name, parent in self.orphans:
+            print(f'  {record_name} -> {parent} (missing)')
+        print(f'unreachable:  {len(self.unreachable)}')
+        print('OK' if self.is_clean() else 'TAMPERING OR DAMAGE DETECTED')
+
+# Check every record in the store exactly once: hash all records in a process
+# pool, compare each pointer hash with the parent's actual hash, and walk the
+# DAG in topological order from the genesis records to find the records that
+# can't be traced back to them.
+def audit_store(record_storage: RecordStorage, workers: Optional[int] = None,
+                batch_size: int = 1000) -> AuditReport:
+    report = AuditReport()
+    summaries: Dict[str, RecordSummary] = {}
+    def add_summaries(batch_summaries: List[Tuple[str, RecordSummary]]) -> None:
+        for record_name, summary in batch_summaries:
+            summaries[record_name] = summary
+    # Only a few batches per worker are read and in flight at a time, so the
+    # store is streamed through the pool instead of read into memory first.
+    max_in_flight = 2 * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        for batch in batched(record_storage.iter_encoded_records(), batch_size):
+            in_flight.append(pool.submit(summarize_records, batch))
+            if (len(in_flight) >= max_in_flight):
+                add_summaries(in_flight.popleft().result())
+        while (in_flight):
+            add_summaries(in_flight.popleft().result())
+    report.num_records = len(summaries)
+
+    # Check links.
+    intact: Dict[str, bool] = {}
+    children: Dict[str, List[str]] = {}
+    num_parents: Dict[str, int] = {}
+    for record_name, summary in summaries.items():
+        if (summary is None):
+            report.malformed.append(record_name)
+            continue
+        _, pointers, pointer_hashes, is_genesis = summary
+        ok = is_genesis or len(pointers) > 0
+        if (not ok):
+            report.unlinked.append(record_name)
+        if (len(pointers) != len(pointer_hashes)):
+            ok = False
+        num_parents[record_name] = 0
+        for ptr, ptr_hash in zip(pointers, pointer_hashes):
+            parent = summaries.get(ptr)
+            if (ptr not in summaries):
+                report.orphans.append((record_name, ptr))
+                ok = False
+                continue
+            if (parent is None):
+                ok = False
+                continue
+            # Genesis records are created locally by each logger, so their hashes aren't checked.
+            if (not parent[3] and parent[0] != ptr_hash):
+                report.broken_links.append((record_name, ptr, ptr_hash, parent[0]))
+                ok = False
+            children.setdefault(ptr, []).append(record_name)
+            num_parents[record_name] += 1
+        intact[record_name] = ok
+
+    # Topological order (Kahn's algorithm), marking records reachable from genesis.
+    reachable: Dict[str, bool] = {}
+    ready = deque(name for name, count in num_parents.items() if count == 0)
+    while (ready):
+        record_name = ready.popleft()
+        report.order.append(record_name)
+        summary = summaries[record_name]
+        reachable[record_name] = summary[3] or (
+            intact[record_name] and all(reachable.get(ptr, False) for ptr in summary[1]))
+        for child in children.get(record_name, ()):
+            num_parents[child] -= 1
+            if (num_parents[child] == 0):
+                ready.append(child)
+    for record_name in num_parents:
+        if (not reachable.get(record_name, False)):
+            report.unreachable.append(record_name)
+    return report
+
+def main() -> int:
+    args = parse_cmd_args()
+    record_storage = RecordStorage(args["store"], args["store_path"], read_only=True)
+    try:
+        report = audit_store(record_storage, args["workers"], args["batch_size"])
+    finally:
+        record_storage.close()
+    report.print()
+    if (args["json"] is not None):
+        with open(args["json"], 'w') as f:
+            json.dump(report.to_dict(), f, indent=2)
+    return 0 if report.is_clean() else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
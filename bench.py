@@ -0,0 +1,305 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser, SUPPRESS
+from typing import Callable, Dict, List, Optional, Tuple
+# NDN Imports
+from ndn.encoding import Name
+# Custom Imports
+sys.path.insert(0,'.')
+from consumer import Logger
+from record import Record, GenesisRecord
+from record_storage import RecordStorage
+
+# Benchmarks for record encoding, storage and the logger's record logic.
+# Runs without NFD: loggers use StubSVSync, and their records are handed to
+# each other directly.
+
+def parse_cmd_args() -> dict:
+    # Command Line Parser
+    parser = ArgumentParser(add_help=False,description="Benchmark record creation, encoding, storage and DAG validation.")
+    optionalArgs = parser.add_argument_group("optional arguments")
+    informationArgs = parser.add_argument_group("information arguments")
+    # Adding all Command Line Arguments
+    optionalArgs.add_argument("-e","--events",action="store",dest="events",type=int,default=2000,required=False,help="log events in the synthetic stream (default: 2000)")
+    optionalArgs.add_argument("-l","--loggers",action="store",dest="loggers",type=int,default=3,required=False,help="loggers sharing records with each other, i.e. the fan-in of each logger (default: 3)")
+    optionalArgs.add_argument("--out-of-order",action="store",dest="out_of_order",type=float,default=0.1,required=False,help="fraction of records delivered late to other loggers (default: 0.1)")
+    optionalArgs.add_argument("--reorder-window",action="store",dest="reorder_window",type=int,default=20,required=False,help="max events a late record is delayed by (default: 20)")
+    optionalArgs.add_argument("-s","--store",action="store",dest="store",default="dbm",choices=["dbm","sqlite","segment"],required=False,help="record store backend (default: dbm)")
+    optionalArgs.add_argument("--record-version",action="store",dest="record_version",type=int,default=2,choices=[1,2],required=False,help="record format (default: 2)")
+    optionalArgs.add_argument("--seed",action="store",dest="seed",type=int,default=1,required=False,help="random seed (default: 1)")
+    optionalArgs.add_argument("--tracemalloc",action="store_true",dest="tracemalloc",default=False,required=False,help="measure peak memory allocated per stage (slows down all stages)")
+    optionalArgs.add_argument("-o","--output",action="store",dest="output",default=None,required=False,help="write results to this JSON file")
+    optionalArgs.add_argument("--compare",action="store",dest="compare",default=None,required=False,help="compare with results from an earlier JSON file")
+    informationArgs.add_argument("-h","--help",action="help",default=SUPPRESS,help="show this help message and exit")
+    # Getting all Arguments
+    argvars = parser.parse_args()
+    return vars(argvars)
+
+# Stand-in for SVSync that records publications instead of sending them.
+class StubSVSync:
+    class StateTable:
+        def getSeqno(self, nid) -> Optional[int]:
+            return None
+
+    class Core:
+        def getStateTable(self):
+            return StubSVSync.StateTable()
+
+    def __init__(self, app, group_prefix, nid, update_callback) -> None:
+        self.group_prefix = group_prefix
+        self.nid = nid
+        self.published: List[bytes] = []
+
+    def publishData(self, data: bytes) -> None:
+        self.published.append(bytes(data))
+
+    async def fetchData(self, nid, seqno: int, retries: int = 0) -> Optional[bytes]:
+        return None
+
+    def getDataName(self, nid, seqno: int):
+        return nid + self.group_prefix + Name.from_str("/data/" + str(seqno))
+
+    def getCore(self):
+        return StubSVSync.Core()
+
+# Times each operation of one stage.
+class Stage:
+    def __init__(self, name: str, use_tracemalloc: bool) -> None:
+        self.name = name
+        self.use_tracemalloc = use_tracemalloc
+        self.latencies: List[int] = []
+        self.total_ns: int = 0
+        self.memory_kb: Optional[float] = None
+
+    def __enter__(self):
+        if (self.use_tracemalloc):
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if (self.use_tracemalloc):
+            self.memory_kb = tracemalloc.get_traced_memory()[1] / 1024
+            tracemalloc.stop()
+
+    def run(self, fn: Callable, *args):
+        start = time.perf_counter_ns()
+        ret = fn(*args)
+        elapsed = time.perf_counter_ns() - start
+        self.latencies.append(elapsed)
+        self.total_ns += elapsed
+        return ret
+
+    def result(self) -> dict:
+        latencies = sorted(self.latencies)
+        def percentile(p: float) -> float:
+            if (not latencies):
+                return 0
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] / 1000
+        seconds = self.total_ns / 1e9
+        return {
+            'ops': len(latencies),
+            'seconds': seconds,
+            'ops_per_sec': len(latencies) / seconds if seconds > 0 else 0,
+            'latency_us': {
+                'mean': (sum(latencies) / len(latencies) / 1000) if latencies else 0,
+                'p50': percentile(0.5),
+                'p90': percentile(0.9),
+                'p99': percentile(0.99),
+                'max': latencies[-1] / 1000 if latencies else 0,
+            },
+            'memory_kb': self.memory_kb,
+        }
+
+# A chain of records, each pointing to the two before it.
+# Returns (record name, pointers, pointer hashes, log event) for each record.
+def make_record_specs(num: int, version: int) -> List[tuple]:
+    genesis = [GenesisRecord(0), GenesisRecord(1)]
+    parents = [(g.get_record_name(), g.get_record_hash()) for g in genesis]
+    specs = []
+    for i in range(num):
+        event_name = Name.from_str("/producer_1/svs/mnemosyne/log_events/data/" + str(i))
+        record = Record(producer_name="/svs/mnemosyne/records/bench",
+                        log_event=str(i), event_name=event_name, version=version)
+        for name, record_hash in parents:
+            record.add_pointer(name, record_hash)
+        specs.append((event_name, parents, str(i)))
+        parents = [parents[1], (record.get_record_name(), record.get_record_hash())]
+    return specs
+
+# Record encoding, decoding and hashing on their own.
+def bench_records(args: dict, results: Dict[str, dict]) -> List[Tuple[str, bytes]]:
+    specs = make_record_specs(args["events"], args["record_version"])
+    def encode(event_name, parents, log_event) -> Tuple[str, bytes]:
+        record = Record(producer_name="/svs/mnemosyne/records/bench",
+                        log_event=log_event, event_name=event_name,
+                        version=args["record_version"])
+        for name, record_hash in parents:
+            record.add_pointer(name, record_hash)
+        return record.get_record_name_str(), record.wire_encode()
+    with Stage('wire_encode', args["tracemalloc"]) as stage:
+        encoded = [stage.run(encode, *spec) for spec in specs]
+    results[stage.name] = stage.result()
+
+    def decode(data: bytes) -> Record:
+        record = Record(data=data)
+        record.get_record_name()
+        record.get_pointers_from_header()
+        record.get_pointer_hashes_from_header()
+        record.get_log_event()
+        return record
+    with Stage('record_decode', args["tracemalloc"]) as stage:
+        decoded = [stage.run(decode, data) for _, data in encoded]
+    results[stage.name] = stage.result()
+
+    with Stage('get_record_hash', args["tracemalloc"]) as stage:
+        for record in decoded:
+            stage.run(record.get_record_hash)
+    results[stage.name] = stage.result()
+    return encoded
+
+# RecordStorage writes, then cold (uncached) and warm (cached) reads.
+def bench_storage(args: dict, results: Dict[str, dict], workdir: str,
+                  encoded: List[Tuple[str, bytes]]) -> None:
+    store_path = os.path.join(workdir, "bench_store")
+    record_storage = RecordStorage(args["store"], store_path)
+    with Stage('store_record', args["tracemalloc"]) as stage:
+        for name, data in encoded:
+            stage.run(record_storage.store_record, name, data)
+        stage.run(record_storage.flush)
+    results[stage.name] = stage.result()
+    record_storage.close()
+
+    record_storage = RecordStorage(args["store"], store_path, cache_size=0)
+    names = [name for name, _ in encoded]
+    random.shuffle(names)
+    with Stage('get_record_cold', args["tracemalloc"]) as stage:
+        for name in names:
+            stage.run(record_storage.get_record, name)
+    results[stage.name] = stage.result()
+    record_storage.close()
+
+    record_storage = RecordStorage(args["store"], store_path)
+    hot = names[:16]
+    with Stage('get_record_warm', args["tracemalloc"]) as stage:
+        for i in range(len(names)):
+            stage.run(record_storage.get_record, hot[i % len(hot)])
+    results[stage.name] = stage.result()
+    record_storage.close()
+
+# Several loggers turning a stream of log events into records and receiving
+# each other's records, some of them late.
+def bench_loggers(args: dict, results: Dict[str, dict], workdir: str) -> None:
+    loggers = []
+    for i in range(args["loggers"]):
+        node_id = "/bench" + str(i)
+        loggers.append(Logger({
+            "node_id": node_id,
+            "store": args["store"],
+            "store_path": os.path.join(workdir, "record_store_bench" + str(i)),
+            "record_version": args["record_version"],
+            "quiet": True,
+        }, svs_class=StubSVSync))
+    # (due event number, receiving logger, record packet)
+    delayed: List[Tuple[int, Logger, bytes]] = []
+    create_stage = Stage('create_record', False)
+    receive_stage = Stage('receive_records', False)
+    # Both stages run interleaved, so memory is measured for them together.
+    with Stage('logger_pipeline', args["tracemalloc"]) as pipeline:
+        for i in range(args["events"]):
+            logger = loggers[i % len(loggers)]
+            event_name = Name.from_str("/producer_1/svs/mnemosyne/log_events/data/" + str(i))
+            create_stage.run(logger.receive_log_event, str(i).encode(), event_name)
+            record_packet = logger.svs_records.published[-1]
+            for other in loggers:
+                if (other is logger):
+                    continue
+                if (random.random() < args["out_of_order"]):
+                    delayed.append((i + random.randint(1, args["reorder_window"]), other, record_packet))
+                else:
+                    receive_stage.run(other.receive_records, record_packet)
+            due = [d for d in delayed if d[0] <= i]
+            delayed = [d for d in delayed if d[0] > i]
+            for _, other, packet in due:
+                receive_stage.run(other.receive_records, packet)
+        for _, other, packet in delayed:
+            receive_stage.run(other.receive_records, packet)
+    results[create_stage.name] = create_stage.result()
+    results[receive_stage.name] = receive_stage.result()
+    results[pipeline.name] = {'memory_kb': pipeline.memory_kb}
+
+    logger = loggers[0]
+    last_record = logger.record_storage.get_record(Name.to_str(logger.last_record_name))
+    with Stage('is_record_valid_full_audit', args["tracemalloc"]) as stage:
+        valid = stage.run(logger.is_record_valid, logger.last_record_name,
+                          last_record.get_record_hash(), True)
+    results[stage.name] = stage.result()
+    results[stage.name]['valid'] = valid
+    results['orphans_left'] = {'count': sum(len(l.orphan_index) for l in loggers)}
+    for logger in loggers:
+        logger.close()
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(results: Dict[str, dict], baseline: Optional[Dict[str, dict]]) -> None:
+    print(f'{"stage":<28}{"ops/s":>12}{"p50 us":>10}{"p99 us":>10}{"max us":>12}{"mem KB":>10}', end='')
+    print(f'{"vs base":>10}' if baseline else '')
+    for name, result in results.items():
+        if ('latency_us' not in result):
+            continue
+        latency = result['latency_us']
+        memory = f'{result["memory_kb"]:.0f}' if result['memory_kb'] is not None else '-'
+        print(f'{name:<28}{result["ops_per_sec"]:>12.0f}{latency["p50"]:>10.1f}'
+              f'{latency["p99"]:>10.1f}{latency["max"]:>12.1f}{memory:>10}', end='')
+        if (baseline):
+            base = baseline.get(name)
+            if (base and base.get('ops_per_sec')):
+                print(f'{result["ops_per_sec"] / base["ops_per_sec"]:>9.2f}x', end='')
+        print('')
+
+def main() -> int:
+    args = parse_cmd_args()
+    random.seed(args["seed"])
+    workdir = tempfile.mkdtemp(prefix="mnemosyne_bench_")
+    results: Dict[str, dict] = {}
+    try:
+        # The logger prints every record it creates or receives.
+        with contextlib.redirect_stdout(io.StringIO()):
+            encoded = bench_records(args, results)
+            bench_storage(args, results, workdir, encoded)
+            bench_loggers(args, results, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = None
+    if (args["compare"] is not None):
+        with open(args["compare"]) as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+    if (args["output"] is not None):
+        with open(args["output"], 'w') as f:
+            json.dump({
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'params': {k: v for k, v in args.items() if k not in ('output', 'compare')},
+                'results': results,
+            }, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+import os
+import time
+from typing import Dict, Optional, Tuple
+from ndn.encoding import Name, TlvModel, BytesField, UintField, ModelField, RepeatedField, Signer
+
+class CheckpointTypes:
+    CHECKPOINT = 330
+    BODY = 331
+    KEY_NAME = 332
+    SIGNATURE_VALUE = 333
+    NODE_ID = 334
+    CREATED = 335
+    LAST_RECORD_NAME = 336
+    TAIL_RECORD = 337
+    EVENT_SEQNO = 338
+    RECORD_SEQNO = 339
+    SEQNO_NODE = 340
+    SEQNO = 341
+
+class NodeSeqnoTlv(TlvModel):
+    nid = BytesField(CheckpointTypes.SEQNO_NODE)
+    seqno = UintField(CheckpointTypes.SEQNO)
+
+# A summary of a logger's state, enough to restart it (or start another
+# logger) without replaying the SVS history:
+# - its last record,
+# - the frontier: the newest tails (see tail_index.py) as encoded records,
+#   all of which were validated by the logger,
+# - the watermark: per node, the sequence number up to which the node's log
+#   events and records have been processed. For the logger's own node, the
+#   number of records it has published.
+class CheckpointTlv(TlvModel):
+    node_id = BytesField(CheckpointTypes.NODE_ID)
+    created = UintField(CheckpointTypes.CREATED)
+    last_record_name = BytesField(CheckpointTypes.LAST_RECORD_NAME)
+    tail_records = RepeatedField(BytesField(CheckpointTypes.TAIL_RECORD))
+    event_seqnos = RepeatedField(ModelField(CheckpointTypes.EVENT_SEQNO, NodeSeqnoTlv))
+    record_seqnos = RepeatedField(ModelField(CheckpointTypes.RECORD_SEQNO, NodeSeqnoTlv))
+
+# The encoded checkpoint and, if the logger signs, its key and signature over it.
+class SignedCheckpointTlv(TlvModel):
+    body = BytesField(CheckpointTypes.BODY)
+    key_name = BytesField(CheckpointTypes.KEY_NAME)
+    signature_value = BytesField(CheckpointTypes.SIGNATURE_VALUE)
+
+class CheckpointFrame(TlvModel):
+    checkpoint = ModelField(CheckpointTypes.CHECKPOINT, SignedCheckpointTlv)
+
+def seqnos_to_tlv(seqnos: Dict[str, int]):
+    entries = []
+    for nid, seqno in seqnos.items():
+        entry = NodeSeqnoTlv()
+        entry.nid = nid.encode()
+        entry.seqno = seqno
+        entries.append(entry)
+    return entries
+
+def seqnos_from_tlv(entries) -> Dict[str, int]:
+    return {bytes(entry.nid).decode(): entry.seqno for entry in entries}
+
+def new_checkpoint(node_id: str) -> CheckpointTlv:
+    checkpoint = CheckpointTlv()
+    checkpoint.node_id = node_id.encode()
+    checkpoint.created = int(time.time() * 1000)
+    return checkpoint
+
+def encode_checkpoint(checkpoint: CheckpointTlv, signer: Optional[Signer] = None) -> bytes:
+    signed = SignedCheckpointTlv()
+    signed.body = bytes(checkpoint.encode())
+    if (signer is not None):
+        signed.key_name = Name.to_bytes(signer.key_name)
+        signature_value = bytearray(signer.get_signature_value_size())
+        size = signer.write_signature_value(signature_value, [signed.body])
+        signed.signature_value = bytes(signature_value[:size])
+    frame = CheckpointFrame()
+    frame.checkpoint = signed
+    return bytes(frame.encode())
+
+# Returns the checkpoint and the signed checkpoint around it, whose
+# key_name and signature_value are None if the checkpoint isn't signed.
+def decode_checkpoint(data) -> Tuple[CheckpointTlv, SignedCheckpointTlv]:
+    try:
+        signed = CheckpointFrame.parse(data).checkpoint
+        checkpoint = CheckpointTlv.parse(signed.body)
+    except Exception:
+        raise RuntimeError('Malformed checkpoint.')
+    if (checkpoint.node_id is None):
+        raise RuntimeError('Malformed checkpoint.')
+    return checkpoint, signed
+
+def write_checkpoint_file(path: str, data: bytes) -> None:
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+def read_checkpoint_file(path: str) -> Optional[bytes]:
+    if (not os.path.exists(path)):
+        return None
+    with open(path, 'rb') as f:
+        return f.read()
@@ -1,20 +1,43 @@
 import asyncio as aio
+import atexit
 import logging
+import os
 import sys
-import random
+import threading
 from argparse import ArgumentParser, SUPPRESS
-from typing import List, Optional, Set, Tuple
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
 # NDN Imports
 from ndn.app import NDNApp
-from ndn.encoding import Name, FormalName
+from ndn.encoding import Name, Component
 # Custom Imports
 sys.path.insert(0,'.')
 from ndn.svs import SVSync, SVSyncLogger, MissingData
-from record import Record, GenesisRecord
+from record import Record, GenesisRecord, MAX_RECORD_SIZE
+from record_id import RecordId
 from record_storage import RecordStorage
+from validation_cache import ValidationCache
+from fetch_scheduler import FetchScheduler
+from orphan_index import OrphanIndex
+from metrics import Metrics
+from record_worker import RecordWorker
+from event_batch import decode_event_batch, batch_log_event, split_batch
+from record_signing import RecordSigner, RecordVerifier, is_record_signature, decode_record_signature
+from checkpoint import CheckpointTlv, new_checkpoint, encode_checkpoint, decode_checkpoint, seqnos_to_tlv, seqnos_from_tlv, read_checkpoint_file, write_checkpoint_file
 
 app = NDNApp()
 
+# Checkpoints are served to peers as one NDN packet, so they hold at most
+# MAX_CHECKPOINT_TAILS tail records, and only as many as fit in
+# MAX_CHECKPOINT_SIZE bytes once encoded and signed.
+MAX_CHECKPOINT_TAILS = 16
+MAX_CHECKPOINT_SIZE = MAX_RECORD_SIZE
+# Upper bound on the bytes a checkpoint's signature, key name and framing add.
+CHECKPOINT_SIGNATURE_OVERHEAD = 256
+# Upper bound on the bytes of a tail record's TLV type and length.
+CHECKPOINT_TAIL_OVERHEAD = 6
+
 def parse_cmd_args() -> dict:
     # Command Line Parser
     parser = ArgumentParser(add_help=False,description="Logger node receiving log events and putting them into a DAG as records.")
@@ -24,187 +47,733 @@ def parse_cmd_args() -> dict:
     # Adding all Command Line Arguments
     requiredArgs.add_argument("-n", "--nodename",action="store",dest="node_name",required=True,help="id of this node in svs")
     optionalArgs.add_argument("-v","--verbose",action="store_true",dest="verbose",default=False,required=False,help="when set, svsync info is displayed as well")
+    optionalArgs.add_argument("-q","--quiet",action="store_true",dest="quiet",default=False,required=False,help="when set, records are not printed as they are published and received")
+    optionalArgs.add_argument("--metrics-port",action="store",dest="metrics_port",type=int,default=None,required=False,help="serve metrics over HTTP on this port, as Prometheus text (or JSON at /metrics.json)")
+    optionalArgs.add_argument("--metrics-host",action="store",dest="metrics_host",default="127.0.0.1",required=False,help="address to serve metrics on (default: 127.0.0.1)")
+    optionalArgs.add_argument("--metrics-file",action="store",dest="metrics_file",default=None,required=False,help="periodically write metrics to this file as JSON")
+    optionalArgs.add_argument("--metrics-interval",action="store",dest="metrics_interval",type=float,default=10,required=False,help="seconds between metrics file writes (default: 10)")
+    optionalArgs.add_argument("-s","--store",action="store",dest="store",default="dbm",choices=["dbm","sqlite","segment"],required=False,help="record store backend (default: dbm)")
+    optionalArgs.add_argument("--store-path",action="store",dest="store_path",default=None,required=False,help="record store file name (default: record_store_<nodename>)")
+    optionalArgs.add_argument("--batch-size",action="store",dest="batch_size",type=int,default=64,required=False,help="records buffered before a group commit (default: 64)")
+    optionalArgs.add_argument("--flush-interval",action="store",dest="flush_interval",type=int,default=50,required=False,help="max ms a record stays buffered before a group commit (default: 50)")
+    optionalArgs.add_argument("--fetch-window",action="store",dest="fetch_window",type=int,default=16,required=False,help="max fetches in flight per node (default: 16)")
+    optionalArgs.add_argument("--total-fetch-window",action="store",dest="total_fetch_window",type=int,default=64,required=False,help="max fetches in flight across all nodes (default: 64)")
+    optionalArgs.add_argument("--fetch-retry-interval",action="store",dest="fetch_retry_interval",type=float,default=5,required=False,help="seconds between fetching data that couldn't be fetched again (default: 5)")
+    optionalArgs.add_argument("--max-orphans",action="store",dest="max_orphans",type=int,default=100000,required=False,help="max records waiting on missing records (default: 100000)")
+    optionalArgs.add_argument("--record-version",action="store",dest="record_version",type=int,default=2,choices=[1,2],required=False,help="format of records this logger creates; both are always accepted (default: 2)")
+    optionalArgs.add_argument("--cache-size",action="store",dest="cache_size",type=int,default=4096,required=False,help="decoded records kept in memory (default: 4096)")
+    optionalArgs.add_argument("--sync-interval",action="store",dest="sync_interval",type=int,default=1000,required=False,help="max ms between forcing commits to disk, 0 to force every commit (default: 1000)")
+    optionalArgs.add_argument("--no-worker-thread",action="store_false",dest="worker_thread",default=True,required=False,help="process records on the event loop instead of a separate thread")
+    optionalArgs.add_argument("--worker-queue",action="store",dest="worker_queue",type=int,default=1024,required=False,help="records waiting for the worker thread before fetches are held back (default: 1024)")
+    optionalArgs.add_argument("--switch-interval",action="store",dest="switch_interval",type=float,default=2,required=False,help="with the worker thread, the interpreter's thread switch interval in ms, i.e. how often the worker is asked to let the event loop run; 0 keeps Python's default (default: 2)")
+    optionalArgs.add_argument("--batch-records",action="store",dest="batch_records",default="batch",choices=["batch","event"],required=False,help="for event batches from the producer, create one record per batch or one per event (default: batch)")
+    optionalArgs.add_argument("--sign-window",action="store",dest="sign_window",type=int,default=0,required=False,help="sign this logger's records with one signature per this many records, 0 to not sign them (default: 0)")
+    optionalArgs.add_argument("--sign-delay",action="store",dest="sign_delay",type=int,default=1000,required=False,help="max ms a record waits to be signed (default: 1000)")
+    optionalArgs.add_argument("--verify-signatures",action="store_true",dest="verify_signatures",default=False,required=False,help="verify other loggers' record signatures")
+    optionalArgs.add_argument("--verify-workers",action="store",dest="verify_workers",type=int,default=0,required=False,help="worker processes verifying signatures, 0 to use threads (default: 0)")
+    optionalArgs.add_argument("--trust-anchor",action="store",dest="trust_anchor",default="/svs/mnemosyne",required=False,help="identity whose default certificate is the trust anchor (default: /svs/mnemosyne)")
+    optionalArgs.add_argument("--checkpoint-interval",action="store",dest="checkpoint_interval",type=float,default=60,required=False,help="seconds between checkpoints of the logger's state, 0 to disable them (default: 60)")
+    optionalArgs.add_argument("--checkpoint-path",action="store",dest="checkpoint_path",default=None,required=False,help="checkpoint file name (default: <store path>_checkpoint)")
+    optionalArgs.add_argument("--bootstrap",action="store",dest="bootstrap",default=None,required=False,help="without a checkpoint of its own, start from this checkpoint file or peer logger's (node id) checkpoint")
+    optionalArgs.add_argument("--tail-policy",action="store",dest="tail_policy",default="random",choices=["random","oldest","cross-logger"],required=False,help="how new records choose the tail records they point to (default: random)")
+    optionalArgs.add_argument("--max-tails",action="store",dest="max_tails",type=int,default=1024,required=False,help="max tail records to choose from; the oldest are dropped (default: 1024)")
+    optionalArgs.add_argument("--no-index",action="store_false",dest="index",default=True,required=False,help="when set, records are not indexed for queries (see query.py)")
     informationArgs.add_argument("-h","--help",action="help",default=SUPPRESS,help="show this help message and exit")
     # Getting all Arguments
     argvars = parser.parse_args()
     args = {}
     args["node_id"] = argvars.node_name
     args["verbose"] = argvars.verbose
+    args["quiet"] = argvars.quiet
+    args["metrics_port"] = argvars.metrics_port
+    args["metrics_host"] = argvars.metrics_host
+    args["metrics_file"] = argvars.metrics_file
+    args["metrics_interval"] = argvars.metrics_interval
+    args["store"] = argvars.store
+    args["store_path"] = argvars.store_path
+    args["batch_size"] = argvars.batch_size
+    args["flush_interval"] = argvars.flush_interval
+    args["sync_interval"] = argvars.sync_interval
+    args["cache_size"] = argvars.cache_size
+    args["record_version"] = argvars.record_version
+    args["fetch_window"] = argvars.fetch_window
+    args["max_orphans"] = argvars.max_orphans
+    args["total_fetch_window"] = argvars.total_fetch_window
+    args["fetch_retry_interval"] = argvars.fetch_retry_interval
+    args["worker_thread"] = argvars.worker_thread
+    args["worker_queue"] = argvars.worker_queue
+    args["switch_interval"] = argvars.switch_interval
+    args["batch_records"] = argvars.batch_records
+    args["sign_window"] = argvars.sign_window
+    args["sign_delay"] = argvars.sign_delay
+    args["verify_signatures"] = argvars.verify_signatures
+    args["verify_workers"] = argvars.verify_workers
+    args["trust_anchor"] = argvars.trust_anchor
+    args["checkpoint_interval"] = argvars.checkpoint_interval
+    args["checkpoint_path"] = argvars.checkpoint_path
+    args["bootstrap"] = argvars.bootstrap
+    args["tail_policy"] = argvars.tail_policy
+    args["max_tails"] = argvars.max_tails
+    args["index"] = argvars.index
     return args
 
-record_storage = RecordStorage()
-
 class Logger:
-    def __init__(self, args:dict) -> None:
+    # ndn_app and svs_class default to this module's NDNApp and SVSync.
+    # Other values let the logger run without NFD, e.g. for benchmarks.
+    def __init__(self, args:dict, ndn_app:NDNApp=None, svs_class=None) -> None:
         self.args = args
+        ndn_app = ndn_app or app
+        svs_class = svs_class or SVSync
+        self.app = ndn_app
+        # Counters and latencies of each stage of the record pipeline.
+        self.metrics = Metrics(labels={"node": self.args["node_id"]})
+        # With a worker thread, received log events and records are processed
+        # (stored, validated, hashed) on it, one at a time, so the event loop
+        # keeps answering sync interests and fetches. The logger's record
+        # state is then only used on that thread.
+        # Must be created while the event loop is running.
+        self.worker: RecordWorker = None
+        if (self.args.get("worker_thread")):
+            self.worker = RecordWorker(
+                aio.get_event_loop(), self.args.get("worker_queue", 1024))
         # The last record this logger produced.
-        self.last_record_name: FormalName = None
-        # Some recently-received records (same length as num. genesis records).
-        self.last_names: List[FormalName] = []
-        # An index into self.last_names.
-        self.last_name_tops: int = 0
+        self.last_record_name: RecordId = None
         # The records we've received but haven't been able to verify yet.
-        self.no_prev_records: Set[str] = set()
-        self.waiting_referenced_records: List[Tuple[str, str]] = []
+        self.orphan_index = OrphanIndex(
+            self.args.get("max_orphans", 100000),
+            lambda record_name: self.on_loop(self.fetch_missing_parent, record_name))
         self.num_record_links: int = 2
+        # Records and record signatures this logger has published, i.e. its
+        # sequence number in the records group. Changed by record jobs and
+        # read by checkpoints, so it is guarded by publish_lock.
+        self.num_published: int = 0
+        self.publish_lock = threading.Lock()
+        # Missing data isn't fetched until the logger has bootstrapped from a
+        # peer's checkpoint (see bootstrap()).
+        self.bootstrapped = aio.Event()
+        self.bootstrapped.set()
         # log_events group related (communication between producer and loggers)
         self.log_events_group_prefix = "/svs/mnemosyne/log_events"
-        self.svs_log_events:SVSync = SVSync(app, Name.from_str(self.log_events_group_prefix), Name.from_str(self.args["node_id"]), self.log_events_missing_callback)
+        self.svs_log_events:SVSync = svs_class(ndn_app, Name.from_str(self.log_events_group_prefix), Name.from_str(self.args["node_id"]), self.log_events_missing_callback)
         # records_group related (communication between loggers)
         self.records_group_prefix = "/svs/mnemosyne/records"
-        self.svs_records:SVSync = SVSync(app, Name.from_str(self.records_group_prefix), Name.from_str(self.args["node_id"]), self.records_missing_callback)
+        self.svs_records:SVSync = svs_class(ndn_app, Name.from_str(self.records_group_prefix), Name.from_str(self.args["node_id"]), self.records_missing_callback)
         print(f'CONSUMER STARTED! | LOG GROUP PREFIX: {self.log_events_group_prefix} | RECORDS GROUP PREFIX {self.records_group_prefix} | NODE ID: {self.args["node_id"]} |')
         self.node_prefix = self.records_group_prefix + self.args['node_id']
+        # Fetchers for missing log events and records, with several fetches in flight.
+        self.log_events_fetcher = FetchScheduler(
+            lambda nid, seqno: self.fetch_timed("fetch_event", self.svs_log_events, nid, seqno),
+            self.receive_fetched_log_event,
+            self.args.get("fetch_window", 16), self.args.get("total_fetch_window", 64),
+            wait_ready=self.worker.wait_for_capacity if self.worker else None)
+        self.records_fetcher = FetchScheduler(
+            lambda nid, seqno: self.fetch_timed("fetch_record", self.svs_records, nid, seqno),
+            self.receive_fetched_record,
+            self.args.get("fetch_window", 16), self.args.get("total_fetch_window", 64),
+            wait_ready=self.worker.wait_for_capacity if self.worker else None)
+
+        # Storage, kept open for the life of the logger.
+        store_path = self.args.get("store_path") or (
+            "record_store" + self.args["node_id"].replace("/", "_"))
+        self.record_storage = RecordStorage(
+            self.args.get("store", "dbm"), store_path,
+            batch_size=self.args.get("batch_size", 64),
+            flush_interval=self.args.get("flush_interval", 50),
+            sync_interval=self.args.get("sync_interval", 1000),
+            cache_size=self.args.get("cache_size", 4096),
+            tail_policy=self.args.get("tail_policy", "random"),
+            max_tails=self.args.get("max_tails", 1024),
+            index=self.args.get("index", True))
+        # The records new records point to.
+        self.tails = self.record_storage.tails
+        self.tails.own_producer = self.node_prefix
+        self.validation_cache = ValidationCache(store_path + "_validation")
 
         # Make genesis data
+        self.genesis_links: List[Tuple[RecordId, str]] = []
         for i in range(self.num_record_links):
             gen_rec = GenesisRecord(i)
             gen_rec_packet = gen_rec.wire_encode()
             # TODO: sign the packet
 
-            record_storage.store_record(
+            self.record_storage.store_record(
                 gen_rec.get_record_name_str(), gen_rec_packet)
-            self.last_names.append(gen_rec.get_record_name())
+            self.tails.add(gen_rec.get_record_id(), gen_rec.get_record_hash(),
+                           gen_rec.get_record_id().producer)
+            self.genesis_links.append((gen_rec.get_record_id(), gen_rec.get_record_hash()))
 
-    def is_record_valid(self, record_name, record_hash):
-        current_record:Record = record_storage.get_record(Name.to_str(record_name))
-        if (current_record == None):
-            return False
-        if (current_record.is_genesis_record()):
+        # Signing of this logger's records, with the app's default key.
+        self.record_signer: RecordSigner = None
+        if (self.args.get("sign_window")):
+            self.record_signer = RecordSigner(
+                ndn_app.keychain.get_signer({}),
+                self.publish,
+                self.args["sign_window"], self.args.get("sign_delay", 1000) / 1000)
+        # Verification of other loggers' record signatures.
+        self.record_verifier: RecordVerifier = None
+        self.verify_pool: ProcessPoolExecutor = None
+        if (self.args.get("verify_signatures")):
+            # Only imported when needed, since it needs python-ndn's light_versec.
+            from security import get_security
+            if (self.args.get("verify_workers")):
+                self.verify_pool = ProcessPoolExecutor(self.args["verify_workers"])
+            trust_anchor = ndn_app.keychain[self.args.get("trust_anchor", "/svs/mnemosyne")].default_key().default_cert().data
+            self.record_verifier = RecordVerifier(
+                ndn_app, get_security().check_sig, trust_anchor, self.verify_pool)
+        # When verifying signatures, other loggers' records only become tails
+        # (i.e. parents of this logger's records) once a valid signature covers
+        # them. Records waiting for their signature, oldest first (at most
+        # max_orphans), and signed digests of records that aren't ready to be
+        # tails yet (not received, or orphans).
+        self.awaiting_signature: OrderedDict = OrderedDict()
+        self.signed_digests: Dict[RecordId, bytes] = {}
+
+        # Checkpoints of the logger's state, so that it can restart without
+        # replaying the SVS history. Restored here if this logger has one.
+        self.checkpoint_path = self.args.get("checkpoint_path") or (store_path + "_checkpoint")
+        self.latest_checkpoint: bytes = None
+        # Per node: the sequence number of the restored checkpoint's watermark.
+        self.checkpoint_seqnos: Dict[str, int] = {}
+        if (self.args.get("checkpoint_interval")):
+            self.latest_checkpoint = read_checkpoint_file(self.checkpoint_path)
+            if (self.latest_checkpoint is not None):
+                checkpoint, _ = decode_checkpoint(self.latest_checkpoint)
+                self.restore_records(checkpoint, True)
+                self.restore_watermarks(checkpoint)
+            elif (self.args.get("bootstrap")):
+                self.bootstrapped.clear()
+
+        self.metrics.add_gauge("orphans", lambda: len(self.orphan_index))
+        self.metrics.add_gauge("tails", lambda: len(self.tails))
+        for stat in ("added", "resolved", "dropped"):
+            self.metrics.add_counter("orphans_" + stat, lambda stat=stat: self.orphan_index.get_stats()[stat])
+        for stat in ("added", "removed", "dropped"):
+            self.metrics.add_counter("tails_" + stat, lambda stat=stat: self.tails.get_stats()[stat])
+        if (self.record_verifier):
+            self.metrics.add_gauge("awaiting_signature", lambda: len(self.awaiting_signature))
+        self.metrics.add_gauge("failed_fetches",
+                               lambda: self.log_events_fetcher.num_failed() + self.records_fetcher.num_failed())
+        self.metrics.add_gauge("store_size_bytes", self.record_storage.get_size_bytes)
+        self.metrics.add_gauge("store_pending_writes", lambda: len(self.record_storage.pending))
+        self.metrics.add_gauge("record_cache_size", lambda: len(self.record_storage.cache))
+        for stat in ("hits", "misses", "evictions"):
+            self.metrics.add_counter("record_cache_" + stat,
+                                     lambda stat=stat: self.record_storage.get_cache_stats()[stat])
+        if (self.worker):
+            self.metrics.add_gauge("worker_queued", lambda: self.worker.num_queued)
+
+    # Check that a record has the expected hash and links back to the genesis records.
+    # Records verified before are looked up in the validation cache, so a new
+    # record is only checked against its direct parents' cached status.
+    # With full_audit, the cache is ignored and the whole history is re-checked
+    # (each ancestor once per audit); use this for offline audits.
+    def is_record_valid(self, record_name, record_hash, full_audit=False):
+        with self.metrics.timer("is_record_valid"):
+            return self.validate_record(record_name, record_hash, full_audit)
+
+    # Walks the record's unverified ancestors depth first with an explicit
+    # stack, since the history can be far deeper than the recursion limit.
+    # Each stack entry is [record, hash, (pointer, pointer hash) pairs, index of
+    # the next pointer to check]; a record is valid once all its pointers are.
+    def validate_record(self, record_name, record_hash, full_audit):
+        audited = set()
+        def is_validated(record_id, record_hash) -> bool:
+            if (full_audit):
+                return (record_id, record_hash) in audited
+            return self.validation_cache.is_valid(record_id, record_hash)
+
+        stack = []
+        on_stack = set()
+        # Push a record to check its pointers, or return False if it's invalid itself.
+        def push(record_id, record_hash) -> bool:
+            current_record:Record = self.record_storage.get_record(record_id)
+            if (current_record == None or record_id in on_stack):
+                return False
+            links = []
+            if (not current_record.is_genesis_record()):
+                if (record_hash != current_record.get_record_hash()):
+                    return False
+                links = list(zip(current_record.get_pointer_ids(),
+                                 current_record.get_pointer_hashes_from_header()))
+                if (len(links) == 0):
+                    return False
+            stack.append([record_id, record_hash, links, 0])
+            on_stack.add(record_id)
             return True
-        else:
-            if (record_hash != current_record.get_record_hash()):
+
+        record_name_str = RecordId.from_name(record_name)
+        if (is_validated(record_name_str, record_hash)):
+            return True
+        if (not push(record_name_str, record_hash)):
+            return False
+        while (stack):
+            entry = stack[-1]
+            record_id, current_hash, links, i = entry
+            if (i == len(links)):
+                stack.pop()
+                on_stack.discard(record_id)
+                audited.add((record_id, current_hash))
+                self.validation_cache.add(record_id, current_hash)
+                continue
+            entry[3] = i + 1
+            pointer, pointer_hash = links[i]
+            if (not is_validated(pointer, pointer_hash) and not push(pointer, pointer_hash)):
                 return False
+        return True
+
+    async def fetch_timed(self, stage: str, svs: SVSync, nid: str, seqno: int):
+        with self.metrics.timer(stage):
+            content = await svs.fetchData(Name.from_str(nid), seqno)
+        if (content is None):
+            self.metrics.inc(stage + "_failures")
+        return content
+
+    # Run fn(*args) on the worker thread, or right away without one.
+    def run_job(self, fn, *args) -> None:
+        if (self.worker):
+            self.worker.submit(fn, *args)
+        else:
+            fn(*args)
+
+    # Run fn(*args) on the event loop thread. Used for SVS calls and scheduling
+    # fetches, which aren't thread-safe.
+    def on_loop(self, fn, *args) -> None:
+        if (self.worker):
+            self.worker.call_on_loop(fn, *args)
+        else:
+            fn(*args)
+
+    # Commit buffered record writes that have waited long enough.
+    async def flush_periodically(self) -> None:
+        while True:
+            await aio.sleep(self.record_storage.flush_interval)
+            self.run_job(self.record_storage.flush_if_due)
+            if (self.record_signer):
+                self.run_job(self.record_signer.sign_if_due)
+
+    # Fetch data whose fetches failed again, every interval seconds, in case
+    # no new SVS update for its node comes along to retry it.
+    async def retry_fetches_periodically(self, interval: float) -> None:
+        while True:
+            await aio.sleep(interval)
+            aio.ensure_future(self.log_events_fetcher.retry_failed())
+            aio.ensure_future(self.records_fetcher.retry_failed())
+
+    # Record how late the event loop runs a callback scheduled every interval
+    # seconds, i.e. how long SVS interests may wait to be handled.
+    async def monitor_loop_lag(self, interval: float = 0.1) -> None:
+        loop = aio.get_event_loop()
+        while True:
+            scheduled = loop.time() + interval
+            await aio.sleep(interval)
+            self.metrics.observe("event_loop_lag", max(0, loop.time() - scheduled))
+
+    # Checkpoint the logger's state every interval seconds.
+    async def checkpoint_periodically(self, interval: float) -> None:
+        while True:
+            await aio.sleep(interval)
+            # Everything delivered so far is processed before the checkpoint is written.
+            self.run_job(self.write_checkpoint,
+                         dict(self.log_events_fetcher.delivered), dict(self.records_fetcher.delivered))
+
+    def write_checkpoint(self, event_seqnos: Dict[str, int], record_seqnos: Dict[str, int]) -> None:
+        with self.metrics.timer("write_checkpoint"):
+            checkpoint = new_checkpoint(self.args["node_id"])
+            if (self.last_record_name is not None):
+                checkpoint.last_record_name = self.last_record_name.wire
+            checkpoint.event_seqnos = seqnos_to_tlv(event_seqnos)
+            record_seqnos = dict(record_seqnos)
+            with self.publish_lock:
+                record_seqnos[self.args["node_id"]] = self.num_published
+            checkpoint.record_seqnos = seqnos_to_tlv(record_seqnos)
+            # The newest tails that fit, stored oldest first, so that they
+            # keep their age order when restored.
+            size = len(checkpoint.encode()) + CHECKPOINT_SIGNATURE_OVERHEAD
+            tail_records = []
+            for tail in self.tails.newest(MAX_CHECKPOINT_TAILS):
+                record = self.record_storage.get_record(tail.name_str)
+                if (record is None or record.is_genesis_record()):
+                    continue
+                record_packet = bytes(record.wire_encode())
+                size += len(record_packet) + CHECKPOINT_TAIL_OVERHEAD
+                if (size > MAX_CHECKPOINT_SIZE):
+                    break
+                tail_records.append(record_packet)
+            checkpoint.tail_records = list(reversed(tail_records))
+            # The watermark must not get ahead of the stored records.
+            self.record_storage.flush(sync=True)
+            data = encode_checkpoint(
+                checkpoint, self.record_signer.signer if self.record_signer else None)
+            write_checkpoint_file(self.checkpoint_path, data)
+            self.latest_checkpoint = data
+        self.metrics.inc("checkpoints_written")
+
+    # Restore the records and record state in a checkpoint: this logger's own
+    # (own) or a peer's. The checkpoint's records are trusted as validated.
+    def restore_records(self, checkpoint: CheckpointTlv, own: bool) -> None:
+        for record_packet in checkpoint.tail_records:
+            record = Record(data=bytes(record_packet))
+            self.record_storage.store_record(record.get_record_name_str(), bytes(record_packet))
+            self.validation_cache.add(record.get_record_name_str(), record.get_record_hash())
+            self.tails.add(record.get_record_id(), record.get_record_hash(),
+                           record.get_record_id().producer)
+        if (own and checkpoint.last_record_name is not None):
+            self.last_record_name = RecordId.from_wire(checkpoint.last_record_name)
+        record_seqnos = seqnos_from_tlv(checkpoint.record_seqnos)
+        with self.publish_lock:
+            self.num_published = max(self.num_published, record_seqnos.get(self.args["node_id"], 0))
+
+    # Skip the log events and records a checkpoint covers. Runs on the event loop.
+    def restore_watermarks(self, checkpoint: CheckpointTlv) -> None:
+        for nid, seqno in seqnos_from_tlv(checkpoint.event_seqnos).items():
+            self.log_events_fetcher.skip_to(nid, seqno)
+        for nid, seqno in seqnos_from_tlv(checkpoint.record_seqnos).items():
+            if (nid == self.args["node_id"]):
+                # Don't reuse sequence numbers this logger published before.
+                if (seqno > self.svs_records.getCore().getSeqno()):
+                    self.svs_records.getCore().updateMyState(seqno)
             else:
-                isValid = True
-                pointers = current_record.get_pointers_from_header()
-                pointer_hashes = current_record.get_pointer_hashes_from_header()
-                if (len(pointers) > 0):
-                    isValid = True
-                    for i in range(len(pointers)):
-                        isValid = isValid and self.is_record_valid(pointers[i], pointer_hashes[i])
-                    return isValid
-                else:
-                    return False
+                self.records_fetcher.skip_to(nid, seqno)
+                self.checkpoint_seqnos[nid] = seqno
+
+    # Start from a peer's checkpoint, given as a file or the peer's node id,
+    # instead of replaying the SVS history. With --verify-signatures, the
+    # checkpoint must be signed by a trusted key.
+    async def bootstrap(self, source: str) -> None:
+        try:
+            if (os.path.exists(source)):
+                data = read_checkpoint_file(source)
+            else:
+                _, _, data = await self.app.express_interest(
+                    self.records_group_prefix + Name.to_str(Name.from_str(source)) + "/CHECKPOINT",
+                    must_be_fresh=True, can_be_prefix=False)
+            checkpoint, signed = decode_checkpoint(data)
+            if (self.record_verifier is not None and (
+                    signed.key_name is None or not await self.record_verifier.verify_signed(
+                        Name.from_bytes(signed.key_name), signed.body, signed.signature_value))):
+                raise RuntimeError('the checkpoint signature is invalid')
+            self.run_job(self.restore_records, checkpoint, False)
+            self.restore_watermarks(checkpoint)
+            print(f'Bootstrapped from the checkpoint of {bytes(checkpoint.node_id).decode()}')
+        except Exception as e:
+            print(f'Error: could not bootstrap from {source}: {e}. Fetching the whole history instead.')
+        finally:
+            self.bootstrapped.set()
+
+    # Answer interests for this logger's latest checkpoint.
+    def on_checkpoint_interest(self, name, interest_param, app_param) -> None:
+        if (self.latest_checkpoint is not None):
+            self.app.put_data(name, self.latest_checkpoint, freshness_period=1000)
+
+    # Commit everything still buffered and close the stores.
+    def close(self) -> None:
+        if (self.worker):
+            self.worker.close()
+        if (self.args.get("checkpoint_interval")):
+            self.write_checkpoint(
+                dict(self.log_events_fetcher.delivered), dict(self.records_fetcher.delivered))
+        if (self.verify_pool):
+            self.verify_pool.shutdown(wait=False)
+        self.record_storage.close()
+        self.validation_cache.close()
 
     # Given a log event, create and return an NDN record packet.
     def create_record(self, log_event, event_name):
         record = Record(producer_name=self.node_prefix,
                         log_event=log_event,
-                        event_name=event_name)
+                        event_name=event_name,
+                        version=self.args.get("record_version", 2))
+        chosen = set()
         if (self.last_record_name is not None):
-            prospective_link_record: Record = record_storage.get_record(Name.to_str(self.last_record_name))
+            prospective_link_record: Record = self.record_storage.get_record(self.last_record_name)
             if (self.is_record_valid(self.last_record_name, prospective_link_record.get_record_hash())):
                 record.add_pointer(self.last_record_name, prospective_link_record.get_record_hash())
-        record_list = [
-            rec_name for rec_name in self.last_names if (
-                Name.to_str(rec_name) not in self.no_prev_records)]
-        random.shuffle(record_list)
-        for tail_rec in record_list:
-            prospective_link_record: Record = record_storage.get_record(Name.to_str(tail_rec))
-            if (self.is_record_valid(tail_rec, prospective_link_record.get_record_hash())):
-                record.add_pointer(tail_rec, prospective_link_record.get_record_hash())
-            if (len(record.get_pointers_from_header())
-                    >= self.num_record_links):
+                chosen.add(self.last_record_name)
+        # Tails are validated when they are added, so they aren't checked again.
+        for tail in self.tails.select(self.num_record_links - len(chosen), chosen):
+            record.add_pointer(tail.name_str, tail.record_hash)
+        # Not enough tails (e.g. the received records are still waiting on
+        # their parents): fall back to the genesis records, which are always valid.
+        for gen_name, gen_hash in self.genesis_links:
+            if (len(record.get_pointer_ids()) >= self.num_record_links):
                 break
+            if (gen_name not in record.get_pointer_ids()):
+                record.add_pointer(gen_name, gen_hash)
         return record
 
     def log_events_missing_callback(self, missing_list: List[MissingData]) -> None:
         aio.ensure_future(self.on_missing_events(missing_list))
 
     async def on_missing_events(self, missing_list: List[MissingData]) -> None:
-        for i in missing_list:
-            while i.lowSeqno <= i.highSeqno:
-                content_str:Optional[bytes] = (await
-                    self.svs_log_events.fetchData(
-                        Name.from_str(i.nid), i.lowSeqno, 2))
-                if content_str:
-                    self.receive_log_event(
-                        content_str, self.svs_log_events.getDataName(
-                            Name.from_str(i.nid), i.lowSeqno))
-                    # if ((self.args["node_id"] == "/even" and int(content_str.decode()) % 2 == 0)
-                    #     or (self.args["node_id"] == "/odd" and int(content_str.decode()) % 2 == 1)):
-                    #     self.receive_log_event(content_str)
-                i.lowSeqno = i.lowSeqno + 1
-
-    # Creates, stores, and publishes a record.
+        await self.bootstrapped.wait()
+        await self.log_events_fetcher.fetch_missing(missing_list)
+
+    def receive_fetched_log_event(self, nid: str, seqno: int, content_str: bytes) -> None:
+        self.run_job(self.receive_log_event,
+            content_str, self.svs_log_events.getDataName(Name.from_str(nid), seqno))
+
+    # Creates, stores, and publishes a record for a log event, or for a batch of
+    # log events published together by the producer.
+    # A batch becomes one record whose log event is the batch's events and
+    # their Merkle root as JSON, or with --batch-records event, one record per
+    # event named <data name>/seg=<index>. A batch too large for one record
+    # becomes one record per run of events that fits, named
+    # <data name>/seg=<index of the run's first event>.
     def receive_log_event(self, content_str, data_name):
+        events = decode_event_batch(content_str)
+        if (events is None):
+            self.metrics.inc("log_events_received")
+            self.add_record(bytes(content_str).decode(), data_name)
+            return
+        self.metrics.inc("event_batches_received")
+        self.metrics.inc("log_events_received", len(events))
+        if (self.args.get("batch_records", "batch") == "batch"):
+            runs = split_batch(events)
+            if (len(runs) == 1):
+                self.add_record(batch_log_event(events), data_name)
+                return
+            first = 0
+            for run in runs:
+                self.add_record(batch_log_event(run), data_name + [Component.from_segment(first)])
+                first += len(run)
+        else:
+            for i, event in enumerate(events):
+                self.add_record(event.decode(), data_name + [Component.from_segment(i)])
+
+    def add_record(self, log_event: str, event_name) -> None:
         # TODO: authenticate log event
         # Create record.
-        new_record = self.create_record(content_str.decode(), data_name)
+        with self.metrics.timer("create_record"):
+            new_record = self.create_record(log_event, event_name)
         # Encode for sending/storage.
-        record_packet = new_record.wire_encode()
+        with self.metrics.timer("wire_encode"):
+            record_packet = new_record.wire_encode()
+        # A record that can't be published isn't stored or chained either.
+        if (len(record_packet) > MAX_RECORD_SIZE):
+            self.metrics.inc("oversized_records")
+            print(f'Error: record {new_record.get_record_name_str()} is {len(record_packet)} bytes, '
+                  f'over the {MAX_RECORD_SIZE} bytes that fit in a publication')
+            return
+
+        with self.metrics.timer("store_record"):
+            self.record_storage.store_record(
+                new_record.get_record_name_str(), record_packet)
+        self.last_record_name = new_record.get_record_id()
+        self.add_tail(new_record)
+
+        if (not self.args.get("quiet")):
+            print("publishing record:")
+            new_record.print()
 
-        # TODO: Sign the data packet
+        self.publish(record_packet)
+        self.metrics.inc("records_created")
 
-        record_storage.store_record(
-            new_record.get_record_name_str(), record_packet)
-        self.last_record_name = new_record.get_record_name()
+        # Published after the record, so other loggers have the record when they check the signature.
+        if (self.record_signer):
+            with self.metrics.timer("sign_records"):
+                self.record_signer.add(new_record.get_record_name(), new_record.get_record_digest())
 
-        print("publishing record:")
-        new_record.print()
+    # Publish a record or record signature to the records group.
+    def publish(self, packet) -> None:
+        with self.publish_lock:
+            self.num_published += 1
+        self.on_loop(self.publish_record, packet)
 
-        self.svs_records.publishData(record_packet)
+    def publish_record(self, record_packet) -> None:
+        with self.metrics.timer("publish_data"):
+            self.svs_records.publishData(record_packet)
 
     def records_missing_callback(self, missing_list:List[MissingData]) -> None:
         aio.ensure_future(self.on_missing_records(missing_list))
 
     async def on_missing_records(self, missing_list:List[MissingData]) -> None:
-        for i in missing_list:
-            while i.lowSeqno <= i.highSeqno:
-                content_str:Optional[bytes] = await self.svs_records.fetchData(Name.from_str(i.nid), i.lowSeqno, 2)
-                if content_str:
-                    self.receive_records(content_str)
-                i.lowSeqno = i.lowSeqno + 1
+        await self.bootstrapped.wait()
+        await self.records_fetcher.fetch_missing(missing_list)
+
+    def receive_fetched_record(self, nid: str, seqno: int, content_str: bytes) -> None:
+        self.run_job(self.receive_records, content_str)
 
     def receive_records(self, received_data):
+        if (is_record_signature(received_data)):
+            self.receive_record_signature(received_data)
+            return
+        with self.metrics.timer("receive_records"):
+            self.receive_record(received_data)
+        self.metrics.inc("records_received")
+
+    def receive_record(self, received_data):
         received_record = Record(data=received_data)
-        print("received record:")
-        received_record.print()
+        if (not self.args.get("quiet")):
+            print("received record:")
+            received_record.print()
 
         # Verify record
         received_record.check_pointer_count(self.num_record_links)
-        self.verify_previous_record(received_record)
+        with self.metrics.timer("verify_previous_record"):
+            available = self.verify_previous_record(received_record)
 
         # Save record
-        record_storage.store_record(
-            received_record.get_record_name_str(), received_data)
+        with self.metrics.timer("store_record"):
+            self.record_storage.store_record(
+                received_record.get_record_name_str(), received_data)
 
-        self.last_names[self.last_name_tops] = received_record.get_record_name()
-        self.last_name_tops = (self.last_name_tops + 1) % len(self.last_names)
+        if (available):
+            with self.metrics.timer("update_tails"):
+                self.accept_record(received_record)
 
         # TODO: get event out of received record and verify it then add it to a set of seen events so users can see it
 
-    # Verify a record by tracing back to the root.
-    # TODO: Recursive verification. Right now, this just checks that each of the links is there, not that they're also verified.
-    def verify_previous_record(self, record: Record) -> None:
-        for ptr in record.get_pointers_from_header():
-            if (Name.to_str(ptr) in self.no_prev_records
-                    or record_storage.get_record(Name.to_str(ptr)) is None):
-                self.waiting_referenced_records.append((Name.to_str(ptr), record.get_record_name_str()))
-                self.no_prev_records.add(record.get_record_name_str())
-
-        waiting_list: List[str] = []
-        wrr_copy = self.waiting_referenced_records
-        self.waiting_referenced_records = []
-        for pair in wrr_copy:
-            if (pair[0] == record.get_record_name_str()):
-                waiting_list.append(pair[1])
-                self.no_prev_records.discard(pair[1])
+    # A logger's signature over its latest records. It is checked on the event
+    # loop (fetching the signer's key if needed), then compared against the
+    # records, which are received before their signature.
+    def receive_record_signature(self, received_data) -> None:
+        self.metrics.inc("record_signatures_received")
+        if (self.record_verifier is None):
+            return
+        signature = decode_record_signature(received_data)
+        self.on_loop(lambda: aio.ensure_future(self.verify_record_signature(signature)))
+
+    async def verify_record_signature(self, signature) -> None:
+        with self.metrics.timer("verify_signature"):
+            valid = await self.record_verifier.verify(signature)
+        if (not valid):
+            self.metrics.inc("invalid_record_signatures")
+            print(f'Warning: invalid record signature by {Name.to_str(Name.from_bytes(signature.key_name))}')
+            self.run_job(self.reject_signed_records, signature)
+            return
+        self.run_job(self.check_signed_records, signature)
+
+    # Records covered by a valid signature become tails if they were waiting
+    # for it; records that don't match it never do.
+    def check_signed_records(self, signature) -> None:
+        for record_name, record_digest in zip(signature.record_names, signature.record_digests):
+            record_name_str = RecordId.from_wire(record_name)
+            record_digest = bytes(record_digest)
+            record = self.record_storage.get_record(record_name_str)
+            if (record is None):
+                self.metrics.inc("signed_records_missing")
+                self.add_signed_digest(record_name_str, record_digest)
+            elif (record.get_record_digest() != record_digest):
+                self.metrics.inc("signed_records_mismatched")
+                print(f'Warning: record {record_name_str} does not match its signature')
+                if (self.awaiting_signature.pop(record_name_str, None) is not None):
+                    self.metrics.inc("rejected_records")
             else:
-                self.waiting_referenced_records.append(pair)
+                self.metrics.inc("signed_records_verified")
+                if (self.awaiting_signature.pop(record_name_str, None) is not None):
+                    self.make_tail(record)
+                elif (self.orphan_index.is_orphan(record_name_str)):
+                    self.add_signed_digest(record_name_str, record_digest)
+
+    def add_signed_digest(self, record_name: RecordId, record_digest: bytes) -> None:
+        if (len(self.signed_digests) < self.args.get("max_orphans", 100000)):
+            self.signed_digests[record_name] = record_digest
+
+    # The records an invalid signature claims to cover are never made tails.
+    def reject_signed_records(self, signature) -> None:
+        for record_name in signature.record_names:
+            if (self.awaiting_signature.pop(RecordId.from_wire(record_name), None) is not None):
+                self.metrics.inc("rejected_records")
+
+    # Check that the records a received record points to are available.
+    # If some are missing (or waiting on missing records themselves), the record
+    # is tracked as an orphan until they arrive and False is returned. A pointer
+    # to an orphan the index dropped waits on that orphan's missing parents.
+    def verify_previous_record(self, record: Record) -> bool:
+        missing: List[str] = []
+        for ptr in record.get_pointer_ids():
+            if (not self.is_record_available(ptr)):
+                missing.append(ptr)
+            else:
+                missing.extend(self.orphan_index.missing_through_dropped(ptr, self.is_record_available))
+        if (missing):
+            self.orphan_index.add(record.get_record_name_str(), missing)
+            return False
+        return True
+
+    def is_record_available(self, record_name: str) -> bool:
+        return not self.orphan_index.is_orphan(record_name) and self.record_storage.has_record(record_name)
+
+    # A stored record whose parents are all available: make it a tail, and
+    # release the orphans waiting on it, which become tails in turn.
+    def accept_record(self, record: Record) -> None:
+        self.add_tail(record)
+        for released in self.orphan_index.resolve(record.get_record_name_str()):
+            released_record = self.record_storage.get_record(released)
+            if (released_record is not None):
+                self.add_tail(released_record)
+
+    # Once a record is validated (and, when verifying signatures, another
+    # logger's record is covered by a valid signature), it is a tail and the
+    # records it points to aren't.
+    def add_tail(self, record: Record) -> None:
+        record_id = record.get_record_id()
+        if (not self.is_record_valid(record_id, record.get_record_hash())):
+            self.metrics.inc("invalid_records")
+            return
+        if (self.record_verifier is not None and record_id.producer != self.node_prefix):
+            signed_digest = self.signed_digests.pop(record_id, None)
+            if (signed_digest is None):
+                self.awaiting_signature[record_id] = True
+                while (len(self.awaiting_signature) > self.args.get("max_orphans", 100000)):
+                    self.awaiting_signature.popitem(last=False)
+                    self.metrics.inc("unsigned_records_dropped")
+                return
+            if (signed_digest != record.get_record_digest()):
+                self.metrics.inc("signed_records_mismatched")
+                self.metrics.inc("rejected_records")
+                return
+        self.make_tail(record)
+
+    def make_tail(self, record: Record) -> None:
+        record_id = record.get_record_id()
+        for ptr in record.get_pointer_ids():
+            self.tails.remove(ptr)
+        self.tails.add(record_id, record.get_record_hash(), record_id.producer)
 
-        for record_name in waiting_list:
-            self.verify_previous_record(record_storage.get_record(record_name))
+    # Fetch the records a missing record's logger has published, since it should be among them.
+    def fetch_missing_parent(self, record_name: str) -> None:
+        producer_prefix = RecordId.from_name(record_name).producer_name
+        group_prefix = Name.from_str(self.records_group_prefix)
+        if (producer_prefix[:len(group_prefix)] != group_prefix
+                or len(producer_prefix) == len(group_prefix)):
+            return
+        nid = Name.to_str(producer_prefix[len(group_prefix):])
+        known_seqno = self.svs_records.getCore().getStateTable().getSeqno(Name.from_str(nid))
+        if (known_seqno):
+            aio.ensure_future(self.records_fetcher.refetch(nid, known_seqno))
+        # Records from before a restored checkpoint are only fetched when
+        # needed: newest first, until the missing record turns up.
+        if (nid in self.checkpoint_seqnos):
+            record_id = RecordId.from_name(record_name)
+            aio.ensure_future(self.records_fetcher.backfill(
+                nid, self.checkpoint_seqnos[nid],
+                lambda content: not is_record_signature(content) and Record(data=content).get_record_id() == record_id))
 
 async def start(args:dict) -> None:
     logger = Logger(args)
+    atexit.register(logger.close)
+    aio.ensure_future(logger.flush_periodically())
+    aio.ensure_future(logger.monitor_loop_lag())
+    aio.ensure_future(logger.retry_fetches_periodically(args["fetch_retry_interval"]))
+    if (args["checkpoint_interval"]):
+        app.route(logger.node_prefix + "/CHECKPOINT")(logger.on_checkpoint_interest)
+        aio.ensure_future(logger.checkpoint_periodically(args["checkpoint_interval"]))
+    if (not logger.bootstrapped.is_set()):
+        aio.ensure_future(logger.bootstrap(args["bootstrap"]))
+    if (args["metrics_port"] is not None):
+        aio.ensure_future(logger.metrics.serve(args["metrics_host"], args["metrics_port"]))
+    if (args["metrics_file"] is not None):
+        aio.ensure_future(logger.metrics.dump_periodically(args["metrics_file"], args["metrics_interval"]))
 
 def main() -> int:
     args = parse_cmd_args()
     args["node_id"] = Name.to_str(Name.from_str(args["node_id"]))
 
     SVSyncLogger.config(True if args["verbose"] else False, None, logging.INFO)
+    # Process-wide, so it is set here rather than by the worker.
+    if (args["worker_thread"] and args["switch_interval"] > 0):
+        sys.setswitchinterval(args["switch_interval"] / 1000)
 
     try:
         app.run_forever(after_start=start(args))
@@ -0,0 +1,87 @@
+import hashlib
+import json
+import struct
+from typing import List, Optional
+from ndn.encoding import TlvModel, BytesField, ModelField, RepeatedField, DecodeError
+from record import MAX_RECORD_SIZE
+
+class EventBatchTypes:
+    EVENT_BATCH = 310
+    EVENT = 311
+
+# Several log events published as one SVS publication by the producer.
+# A batch is framed in an EVENT_BATCH TLV, so it can't be mistaken for a
+# single text event: its first byte (0xFD) never starts a UTF-8 string.
+class EventBatchTlv(TlvModel):
+    events = RepeatedField(BytesField(EventBatchTypes.EVENT))
+
+class EventBatchFrame(TlvModel):
+    batch = ModelField(EventBatchTypes.EVENT_BATCH, EventBatchTlv)
+
+# Upper bound on the bytes an event adds to a batch besides its content.
+EVENT_OVERHEAD = 6
+# Upper bound on the bytes of a batch's record besides its events: the
+# record's name, its pointers and their hashes, and the JSON around the events.
+# (Also more than the batch's frame takes.)
+BATCH_RECORD_OVERHEAD = 1024
+
+def encode_event_batch(events: List[bytes]) -> bytes:
+    frame = EventBatchFrame()
+    frame.batch = EventBatchTlv()
+    for event in events:
+        frame.batch.events.append(event)
+    return bytes(frame.encode())
+
+# Get the events in a batch, or None if the content is a single event.
+def decode_event_batch(content) -> Optional[List[bytes]]:
+    if (len(content) == 0 or content[0] != 0xFD):
+        return None
+    try:
+        frame = EventBatchFrame.parse(content)
+    except (DecodeError, IndexError, ValueError, struct.error):
+        return None
+    if (frame.batch is None):
+        return None
+    return [bytes(event) for event in frame.batch.events]
+
+# The root of a binary Merkle tree over the events' SHA-256 digests, as hex.
+# An odd node at the end of a level is paired with itself.
+def merkle_root(events: List[bytes]) -> str:
+    level = [hashlib.sha256(event).digest() for event in events]
+    if (not level):
+        return hashlib.sha256(b'').hexdigest()
+    while (len(level) > 1):
+        if (len(level) % 2 == 1):
+            level.append(level[-1])
+        level = [hashlib.sha256(level[i] + level[i + 1]).digest()
+                 for i in range(0, len(level), 2)]
+    return level[0].hex()
+
+# The log event of a record holding a whole batch. Events are kept as UTF-8
+# rather than escaped, so that a batch's record is about as large as the
+# batch; bytes that aren't UTF-8 are replaced (the Merkle root still covers
+# the events as they were received).
+def batch_log_event(events: List[bytes]) -> str:
+    return json.dumps({
+        'merkle_root': merkle_root(events),
+        'events': [event.decode(errors='replace') for event in events],
+    }, ensure_ascii=False)
+
+# Upper bound on the bytes an event adds to a batch, and to its record's log
+# event (quoted and escaped as JSON). The producer sizes batches with it.
+def batch_event_size(event: bytes) -> int:
+    return len(json.dumps(event.decode(errors='replace'), ensure_ascii=False).encode()) + EVENT_OVERHEAD
+
+# Split a batch's events into runs whose records fit in max_size bytes.
+# An event too large for a record on its own gets a run by itself.
+def split_batch(events: List[bytes], max_size: int = MAX_RECORD_SIZE) -> List[List[bytes]]:
+    runs: List[List[bytes]] = [[]]
+    size = BATCH_RECORD_OVERHEAD
+    for event in events:
+        event_size = batch_event_size(event)
+        if (runs[-1] and size + event_size > max_size):
+            runs.append([])
+            size = BATCH_RECORD_OVERHEAD
+        runs[-1].append(event)
+        size += event_size
+    return runs
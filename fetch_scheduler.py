@@ -0,0 +1,216 @@
+import asyncio as aio
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+# Custom Imports
+from ndn.svs import MissingData
+
+# Fetches missing SVS data with many fetches in flight at once.
+# At most node_window fetches run per node and total_window across all nodes.
+# A fetch that fails is retried up to `retries` times, waiting `backoff`
+# seconds before the first retry and doubling that each time (up to max_backoff).
+# Fetches can complete in any order, but each node's data is handed to
+# deliver(nid, seqno, content) in sequence number order. Data that couldn't
+# be fetched isn't given up on: later data is still delivered, and the failed
+# sequence numbers are fetched again (and delivered when they arrive) on the
+# node's next fetch_missing or on retry_failed.
+# If wait_ready is given, it is awaited before each fetch starts, so that a
+# slow consumer of the data can hold back new fetches.
+class FetchScheduler:
+    def __init__(self,
+                 fetch: Callable[[str, int], Awaitable[Optional[bytes]]],
+                 deliver: Callable[[str, int, bytes], None],
+                 node_window: int = 16,
+                 total_window: int = 64,
+                 retries: int = 3,
+                 backoff: float = 0.1,
+                 max_backoff: float = 2.0,
+                 wait_ready: Optional[Callable[[], Awaitable[None]]] = None):
+        self.fetch = fetch
+        self.deliver = deliver
+        self.node_window = node_window
+        self.total_window = aio.Semaphore(total_window)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.wait_ready = wait_ready
+        self.node_windows: Dict[str, aio.Semaphore] = {}
+        # Per node: sequence numbers requested but not delivered yet, in order.
+        self.queued: Dict[str, Deque[int]] = {}
+        # Per node: fetched data waiting for earlier sequence numbers.
+        self.results: Dict[str, Dict[int, Optional[bytes]]] = {}
+        # Per node: the highest sequence number requested so far.
+        self.requested_high: Dict[str, int] = {}
+        # Per node: the highest sequence number that was delivered or failed,
+        # with everything before it delivered or failed too.
+        self.passed: Dict[str, int] = {}
+        # Per node: sequence numbers whose fetch failed, and haven't been
+        # fetched since; the ones being fetched again are also in retrying.
+        self.failed: Dict[str, Set[int]] = {}
+        self.retrying: Dict[str, Set[int]] = {}
+        # Per node: the highest sequence number delivered, with everything
+        # before it delivered too (i.e. below the first failed one).
+        self.delivered: Dict[str, int] = {}
+        # Per node: the lowest sequence number backfill() has got to, the ones
+        # it couldn't fetch, and a lock so that backfills run one at a time.
+        self.backfill_low: Dict[str, int] = {}
+        self.backfill_failed: Dict[str, Set[int]] = {}
+        self.backfill_locks: Dict[str, aio.Lock] = {}
+
+    def add_node(self, nid: str) -> None:
+        if (nid not in self.queued):
+            self.node_windows[nid] = aio.Semaphore(self.node_window)
+            self.queued[nid] = deque()
+            self.results[nid] = {}
+            self.failed[nid] = set()
+            self.retrying[nid] = set()
+
+    def num_failed(self) -> int:
+        return sum(len(failed) for failed in self.failed.values())
+
+    # Fetch everything in missing_list, and what failed before for the same
+    # nodes. Returns once all of it has been fetched (or failed).
+    async def fetch_missing(self, missing_list: List[MissingData]) -> None:
+        tasks = []
+        for missing in missing_list:
+            self.add_node(missing.nid)
+            tasks.append(aio.ensure_future(self.retry_failed([missing.nid])))
+            low = max(missing.lowSeqno, self.requested_high.get(missing.nid, 0) + 1)
+            if (low > missing.highSeqno):
+                continue
+            self.requested_high[missing.nid] = missing.highSeqno
+            self.queued[missing.nid].extend(range(low, missing.highSeqno + 1))
+            tasks.append(aio.ensure_future(
+                self.fetch_range(missing.nid, low, missing.highSeqno)))
+        if (tasks):
+            await aio.gather(*tasks)
+
+    # Fetch a node's data up to high that hasn't been delivered, e.g. because
+    # something it published is known to be missing: the sequence numbers
+    # whose fetches failed (now, not at their next retry), and any not
+    # requested yet. Data still being fetched is left alone.
+    async def refetch(self, nid: str, high: int) -> None:
+        self.add_node(nid)
+        await aio.gather(self.retry_failed([nid]), self.fetch_missing([MissingData(nid, 1, high)]))
+
+    # Fetch failed sequence numbers again (of the given nodes, or of all of
+    # them; only those in seqnos, if given), delivering each as it arrives.
+    async def retry_failed(self, nids: Optional[List[str]] = None, seqnos: Optional[Set[int]] = None) -> None:
+        tasks = []
+        for nid in (list(self.failed) if nids is None else nids):
+            for seqno in sorted(self.failed.get(nid, ())):
+                if (seqno in self.retrying[nid] or (seqnos is not None and seqno not in seqnos)):
+                    continue
+                self.retrying[nid].add(seqno)
+                tasks.append(aio.ensure_future(self.retry_one(nid, seqno)))
+        if (tasks):
+            await aio.gather(*tasks)
+
+    async def retry_one(self, nid: str, seqno: int) -> None:
+        try:
+            if (self.wait_ready is not None):
+                await self.wait_ready()
+            async with self.node_windows[nid]:
+                async with self.total_window:
+                    content = await self.fetch_with_retries(nid, seqno)
+        finally:
+            self.retrying[nid].discard(seqno)
+        if (content is None):
+            return
+        self.failed[nid].discard(seqno)
+        self.update_delivered(nid)
+        self.deliver_one(nid, seqno, content)
+
+    # Start fetches for a range of one node's sequence numbers as the windows allow.
+    async def fetch_range(self, nid: str, low: int, high: int) -> None:
+        tasks = []
+        for seqno in range(low, high + 1):
+            if (self.wait_ready is not None):
+                await self.wait_ready()
+            await self.node_windows[nid].acquire()
+            await self.total_window.acquire()
+            tasks.append(aio.ensure_future(self.fetch_one(nid, seqno)))
+        await aio.gather(*tasks)
+
+    async def fetch_one(self, nid: str, seqno: int) -> None:
+        try:
+            content = await self.fetch_with_retries(nid, seqno)
+        finally:
+            self.total_window.release()
+            self.node_windows[nid].release()
+        self.results[nid][seqno] = content
+        self.deliver_ready(nid)
+
+    async def fetch_with_retries(self, nid: str, seqno: int) -> Optional[bytes]:
+        content: Optional[bytes] = None
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            try:
+                content = await self.fetch(nid, seqno)
+            except Exception:
+                content = None
+            if (content is not None or attempt == self.retries):
+                break
+            await aio.sleep(delay)
+            delay = min(delay * 2, self.max_backoff)
+        return content
+
+    # Treat a node's data up to seqno as already delivered, e.g. when
+    # restoring a checkpoint. Later fetch_missing calls skip it.
+    def skip_to(self, nid: str, seqno: int) -> None:
+        self.add_node(nid)
+        self.requested_high[nid] = max(self.requested_high.get(nid, 0), seqno)
+        self.passed[nid] = max(self.passed.get(nid, 0), seqno)
+        self.update_delivered(nid)
+
+    # Fetch a node's data up to high (e.g. skipped with skip_to), newest first,
+    # node_window at a time, handing each piece to deliver as it arrives,
+    # until found(content) is true for one of them. A later backfill of the
+    # same node carries on below where the last one stopped (after trying
+    # what it couldn't fetch again), so nothing is fetched twice.
+    async def backfill(self, nid: str, high: int, found: Callable[[bytes], bool]) -> None:
+        lock = self.backfill_locks.setdefault(nid, aio.Lock())
+        async with lock:
+            seqnos = sorted(self.backfill_failed.pop(nid, ()), reverse=True)
+            seqnos.extend(range(self.backfill_low.get(nid, high + 1) - 1, 0, -1))
+            for i in range(0, len(seqnos), self.node_window):
+                window = seqnos[i:i + self.node_window]
+                self.backfill_low[nid] = min(self.backfill_low.get(nid, high + 1), window[-1])
+                results = await aio.gather(*[self.backfill_one(nid, seqno, found) for seqno in window])
+                if (any(results)):
+                    return
+
+    async def backfill_one(self, nid: str, seqno: int, found: Callable[[bytes], bool]) -> bool:
+        async with self.total_window:
+            content = await self.fetch_with_retries(nid, seqno)
+        if (content is None):
+            self.backfill_failed.setdefault(nid, set()).add(seqno)
+            return False
+        self.deliver_one(nid, seqno, content)
+        return found(content)
+
+    def deliver_one(self, nid: str, seqno: int, content: bytes) -> None:
+        try:
+            self.deliver(nid, seqno, content)
+        except Exception as e:
+            print(f'Error: could not process data {seqno} from {nid}: {e}')
+
+    # Deliver this node's data that no longer waits on an earlier sequence
+    # number. Failed fetches are set aside to be fetched again.
+    def deliver_ready(self, nid: str) -> None:
+        queued = self.queued[nid]
+        results = self.results[nid]
+        while (queued and queued[0] in results):
+            seqno = queued.popleft()
+            content = results.pop(seqno)
+            self.passed[nid] = seqno
+            if (content is None):
+                self.failed[nid].add(seqno)
+            self.update_delivered(nid)
+            if (content is not None):
+                self.deliver_one(nid, seqno, content)
+
+    # A node's watermark stays below its first failed sequence number, so that
+    # (e.g. in a checkpoint) it never covers data that wasn't delivered.
+    def update_delivered(self, nid: str) -> None:
+        failed = self.failed[nid]
+        self.delivered[nid] = (min(failed) - 1) if failed else self.passed.get(nid, 0)
@@ -0,0 +1,184 @@
+import asyncio as aio
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional
+
+# Histogram bucket upper bounds in seconds, from 10us to 10s.
+LATENCY_BUCKETS = [1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3,
+                   1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+class Histogram:
+    def __init__(self, buckets: List[float] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        # Observations per bucket (not cumulative); the last one is +Inf.
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.sum: float = 0
+        self.count: int = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self.lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    # Estimate a quantile from the buckets, as the upper bound of its bucket.
+    def quantile(self, q: float) -> float:
+        if (self.count == 0):
+            return 0
+        target = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if (seen >= target):
+                return self.buckets[i] if i < len(self.buckets) else float('inf')
+        return float('inf')
+
+# Times the block it wraps and adds the duration to a histogram.
+class Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: Histogram) -> None:
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(time.perf_counter() - self.start)
+
+# Counters, latency histograms and gauges for a logger, exported in the
+# Prometheus text format over HTTP or dumped to a JSON file.
+# Updating a metric is a few dict lookups and additions under a lock, cheap
+# enough to leave on under load. Metrics are updated from both the event loop
+# and the record worker thread, so every update takes the lock.
+class Metrics:
+    def __init__(self, prefix: str = 'mnemosyne', labels: Optional[Dict[str, str]] = None) -> None:
+        self.prefix = prefix
+        self.labels = labels or {}
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        # Gauges are read when exported.
+        self.gauges: Dict[str, Callable[[], float]] = {}
+        # Counters kept by other objects (e.g. the record cache's hits), also
+        # read when exported.
+        self.counter_readers: Dict[str, Callable[[], int]] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name: str, amount: int = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def histogram(self, name: str) -> Histogram:
+        histogram = self.histograms.get(name)
+        if (histogram is None):
+            with self.lock:
+                histogram = self.histograms.get(name)
+                if (histogram is None):
+                    histogram = self.histograms[name] = Histogram()
+        return histogram
+
+    def observe(self, name: str, seconds: float) -> None:
+        self.histogram(name).observe(seconds)
+
+    # Use as `with metrics.timer('stage'):` to record how long the stage takes.
+    def timer(self, name: str) -> Timer:
+        return Timer(self.histogram(name))
+
+    def get_counters(self) -> Dict[str, int]:
+        with self.lock:
+            counters = dict(self.counters)
+        for name, read in list(self.counter_readers.items()):
+            counters[name] = read()
+        return counters
+
+    def add_counter(self, name: str, read: Callable[[], int]) -> None:
+        self.counter_readers[name] = read
+
+    def add_gauge(self, name: str, read: Callable[[], float]) -> None:
+        self.gauges[name] = read
+
+    def format_labels(self, extra: Optional[Dict[str, str]] = None) -> str:
+        labels = dict(self.labels)
+        if (extra):
+            labels.update(extra)
+        if (not labels):
+            return ''
+        return '{' + ','.join(f'{k}="{v}"' for k, v in labels.items()) + '}'
+
+    # Metrics may be updated from another thread while they are exported, so
+    # exports iterate over copies.
+    def to_prometheus(self) -> str:
+        lines = []
+        for name, value in self.get_counters().items():
+            metric = f'{self.prefix}_{name}_total'
+            lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric}{self.format_labels()} {value}')
+        for name, read in list(self.gauges.items()):
+            metric = f'{self.prefix}_{name}'
+            lines.append(f'# TYPE {metric} gauge')
+            lines.append(f'{metric}{self.format_labels()} {read()}')
+        for name, histogram in list(self.histograms.items()):
+            metric = f'{self.prefix}_{name}_seconds'
+            lines.append(f'# TYPE {metric} histogram')
+            with histogram.lock:
+                counts, total, count = list(histogram.counts), histogram.sum, histogram.count
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets + ['+Inf'], counts):
+                cumulative += bucket_count
+                lines.append(f'{metric}_bucket{self.format_labels({"le": str(bound)})} {cumulative}')
+            lines.append(f'{metric}_sum{self.format_labels()} {total}')
+            lines.append(f'{metric}_count{self.format_labels()} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self) -> dict:
+        return {
+            'time': time.time(),
+            'labels': self.labels,
+            'counters': self.get_counters(),
+            'gauges': {name: read() for name, read in list(self.gauges.items())},
+            'latency_seconds': {
+                name: {
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'p50': histogram.quantile(0.5),
+                    'p99': histogram.quantile(0.99),
+                } for name, histogram in list(self.histograms.items())},
+        }
+
+    # Serve the metrics over HTTP: /metrics.json as JSON, any other path as Prometheus text.
+    async def serve(self, host: str, port: int) -> None:
+        server = await aio.start_server(self.handle_request, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def handle_request(self, reader: aio.StreamReader, writer: aio.StreamWriter) -> None:
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            parts = request_line.decode(errors='replace').split()
+            if (len(parts) > 1 and parts[1] == '/metrics.json'):
+                body = json.dumps(self.to_dict()).encode()
+                content_type = 'application/json'
+            else:
+                body = self.to_prometheus().encode()
+                content_type = 'text/plain; version=0.0.4'
+            writer.write(b'HTTP/1.1 200 OK\r\n'
+                         + f'Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n'.encode()
+                         + b'Connection: close\r\n\r\n' + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    # Write the metrics as JSON to path every interval seconds.
+    async def dump_periodically(self, path: str, interval: float) -> None:
+        while True:
+            await aio.sleep(interval)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.to_dict(), f)
+            os.replace(path + '.tmp', path)
@@ -0,0 +1,123 @@
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional, Set
+
+# Tracks records that can't be verified yet because a record they point to
+# is missing, or is itself waiting on a missing record ("orphans").
+# Stored both ways as {parent name: waiting children} and
+# {child name: parents it waits on}, so adding an orphan and resolving a
+# parent don't need to scan the other orphans.
+# At most max_size orphans are tracked; the oldest is dropped when full.
+# on_missing_parent(name) is called the first time a missing parent is seen,
+# e.g. to fetch it instead of waiting for it to arrive.
+class OrphanIndex:
+    def __init__(self, max_size: int = 100000,
+                 on_missing_parent: Optional[Callable[[str], None]] = None):
+        self.max_size = max_size
+        self.on_missing_parent = on_missing_parent
+        self.waiting_children: Dict[str, Set[str]] = {}
+        self.missing_parents: Dict[str, Set[str]] = {}
+        # {dropped orphan: the parents it was waiting on}, oldest first, for
+        # the last max_size dropped orphans. A dropped orphan is stored, so a
+        # record pointing to it would look available; see missing_through_dropped.
+        self.dropped: OrderedDict = OrderedDict()
+        self.num_added: int = 0
+        self.num_resolved: int = 0
+        self.num_dropped: int = 0
+
+    def __len__(self) -> int:
+        return len(self.missing_parents)
+
+    def is_orphan(self, record_name: str) -> bool:
+        return record_name in self.missing_parents
+
+    # Record that child can't be verified until all of parents are.
+    def add(self, child: str, parents: List[str]) -> None:
+        if (child not in self.missing_parents):
+            self.missing_parents[child] = set()
+            self.num_added += 1
+        for parent in parents:
+            self.missing_parents[child].add(parent)
+            if (parent not in self.waiting_children):
+                self.waiting_children[parent] = set()
+                if (self.on_missing_parent is not None
+                        and parent not in self.missing_parents):
+                    self.on_missing_parent(parent)
+            self.waiting_children[parent].add(child)
+        while (len(self.missing_parents) > self.max_size):
+            self.drop(next(iter(self.missing_parents)))
+
+    # Stop tracking an orphan. The orphans waiting on it wait on its missing
+    # parents instead, so they are still released when those arrive (and are
+    # validated through the dropped record, which is stored).
+    def drop(self, child: str) -> None:
+        parents = self.missing_parents.pop(child, set())
+        for parent in parents:
+            children = self.waiting_children.get(parent)
+            if (children is not None):
+                children.discard(child)
+                if (not children):
+                    del self.waiting_children[parent]
+        for grandchild in self.waiting_children.pop(child, ()):
+            waiting_on = self.missing_parents.get(grandchild)
+            if (waiting_on is None):
+                continue
+            waiting_on.discard(child)
+            for parent in parents:
+                waiting_on.add(parent)
+                self.waiting_children.setdefault(parent, set()).add(grandchild)
+        self.dropped[child] = parents
+        while (len(self.dropped) > self.max_size):
+            self.dropped.popitem(last=False)
+        self.num_dropped += 1
+
+    # The records that a record pointing to record_name still has to wait on
+    # if record_name is a dropped orphan: its parents that aren't available
+    # (is_available(name) is False), following parents that were dropped too.
+    # Dropped orphans whose ancestors have all become available are forgotten.
+    def missing_through_dropped(self, record_name: str, is_available: Callable[[str], bool]) -> List[str]:
+        if (record_name not in self.dropped):
+            return []
+        missing: List[str] = []
+        seen = {record_name}
+        stack = [record_name]
+        while (stack):
+            for parent in self.dropped.get(stack.pop(), ()):
+                if (parent in self.dropped):
+                    if (parent not in seen):
+                        seen.add(parent)
+                        stack.append(parent)
+                elif (not is_available(parent)):
+                    missing.append(parent)
+        if (not missing):
+            for name in seen:
+                del self.dropped[name]
+        return missing
+
+    # A record is now available and verified: release the orphans waiting on it.
+    # Released orphans in turn release the ones waiting on them.
+    # Returns the names of all released records.
+    def resolve(self, record_name: str) -> List[str]:
+        released: List[str] = []
+        worklist = deque([record_name])
+        while (worklist):
+            parent = worklist.popleft()
+            for child in self.waiting_children.pop(parent, ()):
+                parents = self.missing_parents.get(child)
+                if (parents is None):
+                    continue
+                parents.discard(parent)
+                if (not parents):
+                    del self.missing_parents[child]
+                    self.num_resolved += 1
+                    released.append(child)
+                    worklist.append(child)
+        return released
+
+    def get_stats(self) -> dict:
+        return {
+            'orphans': len(self.missing_parents),
+            'awaited_parents': len(self.waiting_children),
+            'added': self.num_added,
+            'resolved': self.num_resolved,
+            'dropped': self.num_dropped,
+        }
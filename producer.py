@@ -1,6 +1,8 @@
 import asyncio as aio
 import logging
+import os
 import sys
+import time
 from argparse import ArgumentParser, SUPPRESS
 from typing import List, Optional
 # NDN Imports
@@ -9,36 +11,185 @@ from ndn.encoding import Name
 # Custom Imports
 sys.path.insert(0,'.')
 from ndn.svs import SVSync, SVSyncLogger, MissingData
+from event_batch import encode_event_batch, batch_event_size, BATCH_RECORD_OVERHEAD
 
 app = NDNApp()
 
+def parse_cmd_args() -> dict:
+    # Command Line Parser
+    parser = ArgumentParser(add_help=False,description="Producer publishing log events to the loggers.")
+    optionalArgs = parser.add_argument_group("optional arguments")
+    informationArgs = parser.add_argument_group("information arguments")
+    # Adding all Command Line Arguments
+    optionalArgs.add_argument("--stdin",action="store_true",dest="stdin",default=False,required=False,help="publish the lines read from stdin as log events")
+    optionalArgs.add_argument("--tail",action="store",dest="tail",default=None,required=False,help="publish the lines appended to this file as log events")
+    optionalArgs.add_argument("--socket",action="store",dest="socket",default=None,required=False,help="publish the lines written to this Unix socket as log events")
+    optionalArgs.add_argument("--batch-events",action="store",dest="batch_events",type=int,default=256,required=False,help="max log events per publication (default: 256)")
+    optionalArgs.add_argument("--batch-bytes",action="store",dest="batch_bytes",type=int,default=8000,required=False,help="max bytes per publication, counted as the record the consumer makes of it (default: 8000)")
+    optionalArgs.add_argument("--batch-delay",action="store",dest="batch_delay",type=int,default=100,required=False,help="max ms a log event waits to be published (default: 100)")
+    optionalArgs.add_argument("-q","--quiet",action="store_true",dest="quiet",default=False,required=False,help="when set, log events are not printed as they are published")
+    informationArgs.add_argument("-h","--help",action="help",default=SUPPRESS,help="show this help message and exit")
+    # Getting all Arguments
+    argvars = parser.parse_args()
+    args = {}
+    args["stdin"] = argvars.stdin
+    args["tail"] = argvars.tail
+    args["socket"] = argvars.socket
+    args["batch_events"] = argvars.batch_events
+    args["batch_bytes"] = argvars.batch_bytes
+    args["batch_delay"] = argvars.batch_delay
+    args["quiet"] = argvars.quiet
+    return args
+
+# Without an ingest source, publishes a counter every interval seconds, one
+# event per publication.
+# In ingest mode (--stdin, --tail or --socket), each line read is a log event.
+# Events are published in batches of up to batch_events events and
+# batch_bytes bytes, and no event waits more than batch_delay ms. A batch is
+# sized as the record the consumer makes of it (JSON-quoted events, plus the
+# record's name and pointers), since that record must fit in one publication too.
+# ndn_app and svs_class replace the NDN app and SVSync, e.g. with the
+# simulated network of simulation.py.
 class Program:
-    def __init__(self) -> None:
+    def __init__(self, args: dict = None, ndn_app: NDNApp = None, svs_class=None) -> None:
+        self.args = args or {}
+        ndn_app = ndn_app or app
+        svs_class = svs_class or SVSync
         self.group_prefix = "/svs/mnemosyne/log_events"
         self.node_id = "producer_1"
-        self.interval = 1
-        self.svs:SVSync = SVSync(app, Name.from_str(self.group_prefix), Name.from_str(self.node_id), self.missing_callback)
+        self.interval = self.args.get("interval", 1)
+        self.svs:SVSync = svs_class(ndn_app, Name.from_str(self.group_prefix), Name.from_str(self.node_id), self.missing_callback)
+        # Events waiting to be published.
+        self.batch: List[bytes] = []
+        self.batch_size: int = BATCH_RECORD_OVERHEAD
+        self.batch_since: float = 0
+        self.batch_events: int = self.args.get("batch_events", 256)
+        self.batch_bytes: int = self.args.get("batch_bytes", 8000)
+        self.batch_delay: float = self.args.get("batch_delay", 100) / 1000
         print(f'PRODUCER STARTED! | GROUP PREFIX: {self.group_prefix} | NODE ID: {self.node_id} |')
-    async def run(self) -> None:
+    # Publish count log events (forever if None).
+    async def run(self, count: Optional[int] = None) -> None:
         num:int = 0
-        while 1:
+        while (count is None or num < count):
             num = num+1
             try:
-                print("produced log event: "+str(num))
+                if (not self.args.get("quiet")):
+                    print("produced log event: "+str(num))
                 self.svs.publishData(str(num).encode())
             except KeyboardInterrupt:
                 sys.exit()
             await aio.sleep(self.interval)
+
+    # Read log events from the configured sources until they are all closed.
+    async def run_ingest(self) -> None:
+        sources = []
+        if (self.args.get("stdin")):
+            sources.append(self.ingest_stdin())
+        if (self.args.get("tail") is not None):
+            sources.append(self.ingest_tail(self.args["tail"]))
+        if (self.args.get("socket") is not None):
+            sources.append(self.ingest_socket(self.args["socket"]))
+        flusher = aio.ensure_future(self.flush_periodically())
+        try:
+            await aio.gather(*sources)
+        finally:
+            flusher.cancel()
+            self.publish_batch()
+
+    # Add a log event to the batch, publishing the batch first if the event doesn't fit.
+    def add_event(self, event: bytes) -> None:
+        size = batch_event_size(event)
+        if (self.batch and self.batch_size + size > self.batch_bytes):
+            self.publish_batch()
+        if (not self.batch):
+            self.batch_since = time.monotonic()
+        self.batch.append(event)
+        self.batch_size += size
+        if (len(self.batch) >= self.batch_events or self.batch_size >= self.batch_bytes):
+            self.publish_batch()
+
+    def publish_batch(self) -> None:
+        if (not self.batch):
+            return
+        if (not self.args.get("quiet")):
+            print(f"produced log event batch: {len(self.batch)} events")
+        self.svs.publishData(encode_event_batch(self.batch))
+        self.batch = []
+        self.batch_size = BATCH_RECORD_OVERHEAD
+
+    async def flush_periodically(self) -> None:
+        while True:
+            await aio.sleep(self.batch_delay / 2)
+            if (self.batch and time.monotonic() - self.batch_since >= self.batch_delay):
+                self.publish_batch()
+
+    def add_line(self, line: bytes) -> None:
+        line = line.rstrip(b'\r\n')
+        if (line):
+            self.add_event(line)
+
+    async def read_lines(self, reader: aio.StreamReader) -> None:
+        while True:
+            line = await reader.readline()
+            if (not line):
+                return
+            self.add_line(line)
+
+    async def ingest_stdin(self) -> None:
+        reader = aio.StreamReader()
+        await aio.get_event_loop().connect_read_pipe(
+            lambda: aio.StreamReaderProtocol(reader), sys.stdin)
+        await self.read_lines(reader)
+
+    # Follow a file like `tail -f`, starting at its current end.
+    # Starts over from the beginning if the file is truncated.
+    async def ingest_tail(self, path: str) -> None:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            partial = b''
+            while True:
+                line = f.readline()
+                if (not line):
+                    if (os.path.getsize(path) < f.tell()):
+                        f.seek(0)
+                        partial = b''
+                    await aio.sleep(self.batch_delay / 2)
+                    continue
+                if (not line.endswith(b'\n')):
+                    partial += line
+                    continue
+                self.add_line(partial + line)
+                partial = b''
+
+    # Accept any number of clients, each writing lines to the socket.
+    async def ingest_socket(self, path: str) -> None:
+        if (os.path.exists(path)):
+            os.unlink(path)
+        server = await aio.start_unix_server(
+            lambda reader, writer: self.read_client(reader, writer), path)
+        async with server:
+            await server.serve_forever()
+
+    async def read_client(self, reader: aio.StreamReader, writer: aio.StreamWriter) -> None:
+        try:
+            await self.read_lines(reader)
+        finally:
+            writer.close()
+
     def missing_callback(self, missing_list:List[MissingData]) -> None:
         pass
 
-async def start() -> None:
-    prog = Program()
-    await prog.run()
+async def start(args: dict) -> None:
+    prog = Program(args)
+    if (args["stdin"] or args["tail"] is not None or args["socket"] is not None):
+        await prog.run_ingest()
+    else:
+        await prog.run()
 
 def main() -> int:
+    args = parse_cmd_args()
     try:
-        app.run_forever(after_start=start())
+        app.run_forever(after_start=start(args))
     except (FileNotFoundError, ConnectionRefusedError):
         print('Error: could not connect to NFD for SVS.')
 
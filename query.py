@@ -0,0 +1,232 @@
+import sqlite3
+import sys
+from argparse import ArgumentParser, SUPPRESS
+from collections import deque
+from typing import Iterable, Iterator, Optional, Tuple
+# NDN Imports
+from ndn.encoding import Name, Component, FormalName
+# Custom Imports
+sys.path.insert(0,'.')
+from record import Record
+
+LOG_EVENTS_GROUP_PREFIX = Name.from_str("/svs/mnemosyne/log_events")
+
+def parse_cmd_args() -> dict:
+    # Command Line Parser
+    parser = ArgumentParser(add_help=False,description="Query a logger's record store.")
+    requiredArgs = parser.add_argument_group("required arguments")
+    optionalArgs = parser.add_argument_group("optional arguments")
+    informationArgs = parser.add_argument_group("information arguments")
+    # Adding all Command Line Arguments
+    requiredArgs.add_argument("--store-path",action="store",dest="store_path",required=True,help="record store file name, e.g. record_store_a")
+    requiredArgs.add_argument("query",action="store",choices=["logger","producer","event","parents","children","ancestors","descendants"],help="records from a logger, for a producer's events, for events under a name prefix, or linked to a record")
+    requiredArgs.add_argument("name",action="store",help="the logger prefix, producer, event name prefix or record name")
+    optionalArgs.add_argument("-s","--store",action="store",dest="store",default="dbm",choices=["dbm","sqlite","segment"],required=False,help="record store backend (default: dbm)")
+    optionalArgs.add_argument("--from",action="store",dest="low",type=int,default=None,required=False,help="producer queries: lowest event sequence number")
+    optionalArgs.add_argument("--to",action="store",dest="high",type=int,default=None,required=False,help="producer queries: highest event sequence number")
+    optionalArgs.add_argument("--depth",action="store",dest="depth",type=int,default=None,required=False,help="ancestor/descendant queries: max links to follow")
+    optionalArgs.add_argument("--limit",action="store",dest="limit",type=int,default=None,required=False,help="max records to list")
+    optionalArgs.add_argument("--show",action="store_true",dest="show",default=False,required=False,help="print each record, not just its name (opens the record store)")
+    optionalArgs.add_argument("--reindex",action="store_true",dest="reindex",default=False,required=False,help="index every stored record first (opens the record store)")
+    informationArgs.add_argument("-h","--help",action="help",default=SUPPRESS,help="show this help message and exit")
+    # Getting all Arguments
+    argvars = parser.parse_args()
+    args = {}
+    args["store_path"] = argvars.store_path
+    args["query"] = argvars.query
+    args["name"] = argvars.name
+    args["store"] = argvars.store
+    args["low"] = argvars.low
+    args["high"] = argvars.high
+    args["depth"] = argvars.depth
+    args["limit"] = argvars.limit
+    args["show"] = argvars.show
+    args["reindex"] = argvars.reindex
+    return args
+
+# Split a record's event name, <producer>/svs/mnemosyne/log_events/data/<seqno>[/...],
+# into the producer and sequence number. Either is None if the name doesn't follow this form.
+def parse_event_name(event_name: FormalName) -> Tuple[Optional[str], Optional[int]]:
+    prefix_length = len(LOG_EVENTS_GROUP_PREFIX)
+    for i in range(len(event_name) - prefix_length + 1):
+        if (event_name[i:i + prefix_length] == LOG_EVENTS_GROUP_PREFIX):
+            seqno = None
+            if (len(event_name) > i + prefix_length + 1):
+                seqno_str = Component.to_str(event_name[i + prefix_length + 1])
+                seqno = int(seqno_str) if seqno_str.isdigit() else None
+            return Name.to_str(event_name[:i]), seqno
+    return None, None
+
+# Secondary indexes over a record store, kept in SQLite next to it
+# (<store path>_index.sqlite):
+# - by logger prefix (Record.get_producer_prefix),
+# - by producer and event sequence number, and by event name (from Record.get_event_name),
+# - links both ways: child -> parent and parent -> child.
+# RecordStorage keeps it up to date as records are committed (see its index
+# option); rebuild() indexes a whole existing store.
+# Queries are generators reading from SQLite cursors, so large results are
+# never held in memory. Walks over ancestors or descendants only remember
+# the records already visited.
+class RecordIndex:
+    def __init__(self, db_name: str = 'record_store_index') -> None:
+        # Records are indexed from the logger's record worker thread when it has one.
+        self.conn = sqlite3.connect(db_name + '.sqlite', timeout=30.0, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS records (name TEXT PRIMARY KEY, logger TEXT NOT NULL,'
+            ' event TEXT NOT NULL, producer TEXT, seqno INTEGER)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS links (child TEXT NOT NULL, parent TEXT NOT NULL,'
+            ' PRIMARY KEY (child, parent))')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS records_logger ON records (logger)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS records_event ON records (event)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS records_producer ON records (producer, seqno)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS links_parent ON links (parent)')
+        self.conn.commit()
+
+    # Index a batch of (name, encoded record) and commit. Records that can't be decoded are skipped.
+    def add_records(self, batch: Iterable[Tuple[str, bytes]]) -> None:
+        rows = []
+        links = []
+        for record_name, encoded_record in batch:
+            try:
+                record = Record(data=encoded_record)
+                event_name = record.get_event_name()
+                producer, seqno = parse_event_name(event_name)
+                rows.append((record_name, Name.to_str(record.get_producer_prefix()),
+                             Name.to_str(event_name), producer, seqno))
+                links.extend((record_name, Name.to_str(ptr)) for ptr in record.get_pointers_from_header())
+            except Exception:
+                continue
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO records (name, logger, event, producer, seqno) VALUES (?, ?, ?, ?, ?)', rows)
+        self.conn.executemany('INSERT OR IGNORE INTO links (child, parent) VALUES (?, ?)', links)
+        self.conn.commit()
+
+    # Index every record in a store, in batches.
+    def rebuild(self, records: Iterator[Tuple[str, bytes]], batch_size: int = 1000) -> None:
+        batch = []
+        for record in records:
+            batch.append(record)
+            if (len(batch) >= batch_size):
+                self.add_records(batch)
+                batch = []
+        self.add_records(batch)
+
+    def __len__(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def stream(self, query: str, params: tuple) -> Iterator[str]:
+        for row in self.conn.execute(query, params):
+            yield row[0]
+
+    def iter_logger(self, logger_prefix: str) -> Iterator[str]:
+        return self.stream('SELECT name FROM records WHERE logger = ? ORDER BY name',
+                           (Name.to_str(Name.from_str(logger_prefix)),))
+
+    # Records for a producer's events, in sequence number order, optionally within [low, high].
+    def iter_producer(self, producer: str, low: Optional[int] = None,
+                      high: Optional[int] = None) -> Iterator[str]:
+        query = 'SELECT name FROM records WHERE producer = ?'
+        params = [Name.to_str(Name.from_str(producer))]
+        if (low is not None):
+            query += ' AND seqno >= ?'
+            params.append(low)
+        if (high is not None):
+            query += ' AND seqno <= ?'
+            params.append(high)
+        return self.stream(query + ' ORDER BY seqno, name', tuple(params))
+
+    # Records for the event name and every event under it.
+    def iter_event_prefix(self, event_prefix: str) -> Iterator[str]:
+        event_prefix = Name.to_str(Name.from_str(event_prefix))
+        if (event_prefix == '/'):
+            return self.stream('SELECT name FROM records ORDER BY event', ())
+        # Names under the prefix sort between "<prefix>/" and "<prefix>0" ('0' follows '/').
+        return self.stream(
+            'SELECT name FROM records WHERE event = ? OR (event >= ? AND event < ?) ORDER BY event',
+            (event_prefix, event_prefix + '/', event_prefix + '0'))
+
+    def iter_parents(self, record_name: str) -> Iterator[str]:
+        return self.stream('SELECT parent FROM links WHERE child = ?', (record_name,))
+
+    def iter_children(self, record_name: str) -> Iterator[str]:
+        return self.stream('SELECT child FROM links WHERE parent = ?', (record_name,))
+
+    def iter_ancestors(self, record_name: str, max_depth: Optional[int] = None) -> Iterator[str]:
+        return self.walk(record_name, self.iter_parents, max_depth)
+
+    def iter_descendants(self, record_name: str, max_depth: Optional[int] = None) -> Iterator[str]:
+        return self.walk(record_name, self.iter_children, max_depth)
+
+    # Breadth-first walk over links, nearest records first.
+    def walk(self, record_name: str, neighbors, max_depth: Optional[int]) -> Iterator[str]:
+        record_name = Name.to_str(Name.from_str(record_name))
+        visited = {record_name}
+        frontier = deque([(record_name, 0)])
+        while (frontier):
+            current, depth = frontier.popleft()
+            if (max_depth is not None and depth >= max_depth):
+                continue
+            for neighbor in list(neighbors(current)):
+                if (neighbor not in visited):
+                    visited.add(neighbor)
+                    yield neighbor
+                    frontier.append((neighbor, depth + 1))
+
+    def close(self) -> None:
+        self.conn.close()
+
+def run_query(index: RecordIndex, args: dict) -> Iterator[str]:
+    query = args["query"]
+    name = args["name"]
+    if (query == "logger"):
+        return index.iter_logger(name)
+    if (query == "producer"):
+        return index.iter_producer(name, args["low"], args["high"])
+    if (query == "event"):
+        return index.iter_event_prefix(name)
+    name = Name.to_str(Name.from_str(name))
+    if (query == "parents"):
+        return index.iter_parents(name)
+    if (query == "children"):
+        return index.iter_children(name)
+    if (query == "ancestors"):
+        return index.iter_ancestors(name, args["depth"])
+    return index.iter_descendants(name, args["depth"])
+
+def main() -> int:
+    args = parse_cmd_args()
+    index = RecordIndex(args["store_path"] + "_index")
+    record_storage = None
+    try:
+        if (args["show"] or args["reindex"] or len(index) == 0):
+            from record_storage import RecordStorage
+            # Read-only, so it can be used while a logger is writing to the store.
+            record_storage = RecordStorage(args["store"], args["store_path"], read_only=True)
+        if (args["reindex"] or len(index) == 0):
+            index.rebuild(record_storage.iter_encoded_records())
+        num_results = 0
+        for record_name in run_query(index, args):
+            if (args["limit"] is not None and num_results >= args["limit"]):
+                break
+            num_results += 1
+            if (args["show"]):
+                record = record_storage.get_record(record_name)
+                if (record is None):
+                    print(f"{record_name} (not stored)\n")
+                else:
+                    record.print()
+            else:
+                print(record_name)
+    except BrokenPipeError:
+        pass
+    finally:
+        index.close()
+        if (record_storage is not None):
+            record_storage.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
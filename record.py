@@ -1,32 +1,66 @@
 from typing import List
-from ndn.encoding import Component, Name, FormalName, NonStrictName, TlvModel, BytesField, RepeatedField
+from ndn.encoding import Name, FormalName, NonStrictName, TlvModel, BytesField, UintField, RepeatedField
+from ndn.encoding.tlv_var import parse_tl_num
 import hashlib
+from record_id import RecordId
+
+# Records are published as one SVS publication, which has to fit in an NDN
+# packet (8800 bytes) together with its name and signature.
+MAX_RECORD_SIZE = 8000
 
 class RecordTypes:
     RECORD_NAME = 301
     RECORD_POINTER = 302
     LOG_EVENT = 303
     RECORD_POINTER_HASH = 304
+    RECORD_VERSION = 305
+    RECORD_POINTER_DIGEST = 306
 
+# Version 1 records have no version field and store each pointer's hash as
+# 64 hex characters. Their hash is computed over the record's name, pointers
+# and log event converted to strings.
+# Version 2 records store each pointer's hash as a raw 32-byte digest, and
+# their hash is the SHA-256 digest of the record's wire encoding.
 class RecordTlv(TlvModel):
     record_name = BytesField(RecordTypes.RECORD_NAME)
+    record_version = UintField(RecordTypes.RECORD_VERSION)
     record_pointers = RepeatedField(BytesField(RecordTypes.RECORD_POINTER))
     record_pointer_hashes = RepeatedField(BytesField(RecordTypes.RECORD_POINTER_HASH))
+    record_pointer_digests = RepeatedField(BytesField(RecordTypes.RECORD_POINTER_DIGEST))
     log_event = BytesField(RecordTypes.LOG_EVENT)
 
 class Record:
+    __slots__ = ('version', 'record_name', 'record_pointers', 'record_pointer_hashes',
+                 'log_event', 'wire', 'name_wire', 'pointer_wires', 'pointer_hash_wires',
+                 'event_wire', 'frozen', 'record_hash', 'record_id', 'pointer_ids')
 
     def __init__(self,
                  record_name: NonStrictName = None,
                  producer_name: NonStrictName = None,
                  log_event: str = None,
                  event_name: FormalName = None,
-                 data: bytearray = None):
+                 data: bytearray = None,
+                 version: int = 2):
+        # Set by freeze(); a frozen record can't be modified.
+        self.frozen: bool = False
+        self.version: int = version
         self.record_name: FormalName = None
         self.record_pointers: List[FormalName] = []
         self.record_pointer_hashes = []
+        # The record's and its pointers' names as RecordIds, once needed.
+        self.record_id: RecordId = None
+        self.pointer_ids: List[RecordId] = []
         self.log_event: str = None
-        self.record_tlv: RecordTlv = None
+        # The record's wire encoding, once it is built or received.
+        self.wire = None
+        # Fields of a received record, as slices of the wire encoding.
+        # They are only decoded when first used.
+        self.name_wire = None
+        self.pointer_wires = None
+        self.pointer_hash_wires = None
+        self.event_wire = None
+        # The record's hash, remembered once the record can no longer change.
+        self.record_hash: str = None
         if (record_name is not None):
             # Create record with the name as provided.
             # Used for genesis records.
@@ -42,16 +76,52 @@ class Record:
         elif (data is not None):
             # Create record from raw data.
             # Used when creating a Record to represent a received Record.
-            self.record_tlv: RecordTlv = RecordTlv.parse(data)
-            self.record_name = Name.from_bytes(self.record_tlv.record_name)
-            for ptr in self.record_tlv.record_pointers:
-                self.record_pointers.append(Name.from_bytes(ptr))
-            for ptr_hash in self.record_tlv.record_pointer_hashes:
-                self.record_pointer_hashes.append(ptr_hash.tobytes().decode())
-            self.log_event = self.record_tlv.log_event.tobytes().decode()
+            self.parse(data)
         else:
             raise RuntimeError('Invalid call to Record constructor')
-    
+
+    # Split a version 1 or 2 wire encoding into its fields without copying them.
+    def parse(self, data) -> None:
+        wire = memoryview(data)
+        pointer_wires = []
+        pointer_hash_wires = []
+        pointer_digest_wires = []
+        self.version = 1
+        offset = 0
+        while (offset < len(wire)):
+            tlv_type, size = parse_tl_num(wire, offset)
+            offset += size
+            length, size = parse_tl_num(wire, offset)
+            offset += size
+            value = wire[offset:offset + length]
+            offset += length
+            if (tlv_type == RecordTypes.RECORD_NAME):
+                self.name_wire = value
+            elif (tlv_type == RecordTypes.RECORD_VERSION):
+                self.version = int.from_bytes(value, 'big')
+            elif (tlv_type == RecordTypes.RECORD_POINTER):
+                pointer_wires.append(value)
+            elif (tlv_type == RecordTypes.RECORD_POINTER_HASH):
+                pointer_hash_wires.append(value)
+            elif (tlv_type == RecordTypes.RECORD_POINTER_DIGEST):
+                pointer_digest_wires.append(value)
+            elif (tlv_type == RecordTypes.LOG_EVENT):
+                self.event_wire = value
+        if (offset != len(wire) or self.name_wire is None):
+            raise RuntimeError('Malformed record.')
+        self.wire = wire
+        self.pointer_wires = pointer_wires
+        self.pointer_hash_wires = pointer_hash_wires if self.version == 1 else pointer_digest_wires
+        self.record_name = None
+        self.record_pointers = None
+        self.record_pointer_hashes = None
+        self.pointer_ids = None
+
+    # Fill in a lazily-decoded field. Allowed on frozen records.
+    def set_decoded(self, field: str, value):
+        object.__setattr__(self, field, value)
+        return value
+
     # This is commented out because full names are currently no
     # different than NDN record names, because names don't contain
     # hashes yet.
@@ -63,35 +133,65 @@ class Record:
     #     if (self.record_tlv is not None):
     #         return self.record_tlv.get_full_name()
     #     return []
+    def __setattr__(self, name, value) -> None:
+        if (getattr(self, 'frozen', False)):
+            raise RuntimeError('Tried to modify a frozen record.')
+        object.__setattr__(self, name, value)
+
+    # Make the record read-only so that it can be shared, e.g. from a cache.
+    def freeze(self) -> None:
+        if (self.record_pointers is not None):
+            self.record_pointers = tuple(self.record_pointers)
+        if (self.record_pointer_hashes is not None):
+            self.record_pointer_hashes = tuple(self.record_pointer_hashes)
+        if (self.pointer_ids is not None):
+            self.pointer_ids = tuple(self.pointer_ids)
+        self.frozen = True
+
     def get_record_hash(self):
-        record_str = Name.to_str(self.get_record_name())
-        if (len(self.record_pointers) >= 1):
-            record_str += (
-                Name.to_str(self.record_pointers[0])
-                + self.record_pointer_hashes[0])
-        if (len(self.record_pointers) >= 2):
-            record_str += (
-                Name.to_str(self.record_pointers[1])
-                + self.record_pointer_hashes[1])
-        record_str += self.get_log_event()
-
-        return hashlib.sha256(record_str.encode()).hexdigest()
+        if (self.record_hash is not None):
+            return self.record_hash
+        if (self.version >= 2):
+            record_hash = hashlib.sha256(self.wire_encode()).hexdigest()
+        else:
+            pointers = self.get_pointer_ids()
+            pointer_hashes = self.get_pointer_hashes_from_header()
+            record_str = self.get_record_name_str()
+            if (len(pointers) >= 1):
+                record_str += pointers[0] + pointer_hashes[0]
+            if (len(pointers) >= 2):
+                record_str += pointers[1] + pointer_hashes[1]
+            record_str += self.get_log_event()
+            record_hash = hashlib.sha256(record_str.encode()).hexdigest()
+        if (self.wire is not None or self.frozen):
+            self.set_decoded('record_hash', record_hash)
+        return record_hash
+
+    # Get the record's hash as raw bytes.
+    def get_record_digest(self) -> bytes:
+        return bytes.fromhex(self.get_record_hash())
 
     # Get the record's name.
     # e.g., /<producer-prefix>/RECORD/<event-name>
     def get_record_name(self) -> FormalName:
+        if (self.record_name is None):
+            return self.set_decoded('record_name', self.get_record_id().name)
         return self.record_name
-    def get_record_name_str(self) -> str:
-        return Name.to_str(self.record_name)
+    def get_record_name_str(self) -> RecordId:
+        return self.get_record_id()
+
+    # Get the record's name as an interned RecordId.
+    def get_record_id(self) -> RecordId:
+        if (self.record_id is None):
+            if (self.name_wire is not None):
+                return self.set_decoded('record_id', RecordId.from_wire(self.name_wire))
+            return self.set_decoded('record_id', RecordId.from_name(self.record_name))
+        return self.record_id
 
     # Get the name of the underlying event.
     # i.e., the <event-name> in /<producer-prefix>/RECORD/<event-name>
     def get_event_name(self) -> FormalName:
-        for i in range(len(self.record_name) - 1):
-            if (Component.to_str(self.record_name[i]) == "GENESIS_RECORD"
-                    or Component.to_str(self.record_name[i]) == "RECORD"):
-                return [self.record_name[i + 1]]
-        return []
+        return self.get_record_id().event_name
 
     # Add the log event to the record.
     # Should only be used in generating record before adding it to ledger.
@@ -100,20 +200,41 @@ class Record:
 
     # Get record payload.
     def get_log_event(self) -> str:
+        if (self.log_event is None and self.event_wire is not None):
+            return self.set_decoded('log_event', bytes(self.event_wire).decode())
         return self.log_event
 
     # Get this record's pointers to other records.
     def get_pointers_from_header(self) -> List[FormalName]:
+        if (self.record_pointers is None):
+            return self.set_decoded('record_pointers', tuple(
+                ptr.name for ptr in self.get_pointer_ids()))
         return self.record_pointers
 
+    # Get this record's pointers as interned RecordIds.
+    def get_pointer_ids(self) -> List[RecordId]:
+        if (self.pointer_ids is None):
+            return self.set_decoded('pointer_ids', tuple(
+                RecordId.from_wire(ptr) for ptr in self.pointer_wires))
+        return self.pointer_ids
+
+    # Get the hashes of the records this record points to, as hex strings.
     def get_pointer_hashes_from_header(self) -> List:
+        if (self.record_pointer_hashes is None):
+            if (self.version == 1):
+                hashes = tuple(bytes(ptr_hash).decode() for ptr_hash in self.pointer_hash_wires)
+            else:
+                hashes = tuple(ptr_hash.hex() for ptr_hash in self.pointer_hash_wires)
+            return self.set_decoded('record_pointer_hashes', hashes)
         return self.record_pointer_hashes
 
     # Add a pointer to another record.
     def add_pointer(self, record_pointer: FormalName, record_hash) -> None:
-        if (self.record_tlv is not None):
+        if (self.wire is not None):
             raise RuntimeError('add_pointer tried to modify an already-built record.')
-        self.record_pointers.append(record_pointer)
+        pointer_id = RecordId.from_name(record_pointer)
+        self.pointer_ids.append(pointer_id)
+        self.record_pointers.append(pointer_id.name)
         self.record_pointer_hashes.append(record_hash)
 
     # Validate the pointers in the header.
@@ -129,46 +250,49 @@ class Record:
             pointers_copy.append(pointer)
 
     def get_producer_prefix(self) -> FormalName:
-        for i in range(len(self.record_name - 1)):
-            if (Component.to_str(self.record_name[i]) == "GENESIS_RECORD"
-                    or Component.to_str(self.record_name[i]) == "RECORD"):
-                return self.record_name[:i]
-        return []
-
-    def wire_encode(self) -> bytearray:
-        self.record_tlv = RecordTlv()
-        self.record_tlv.record_name = Name.to_bytes(self.record_name)
-        for ptr in self.record_pointers:
-            self.record_tlv.record_pointers.append(Name.to_bytes(ptr))
-        for ptr_hash in self.record_pointer_hashes:
-            self.record_tlv.record_pointer_hashes.append(ptr_hash.encode())
-        self.record_tlv.log_event = self.log_event.encode()
-        return self.record_tlv.encode()
+        return self.get_record_id().producer_name
+
+    # Encode the record. Once encoded, the record can't be changed.
+    def wire_encode(self):
+        if (self.wire is not None):
+            return self.wire
+        record_tlv = RecordTlv()
+        record_tlv.record_name = self.get_record_id().wire
+        for ptr in self.pointer_ids:
+            record_tlv.record_pointers.append(ptr.wire)
+        if (self.version == 1):
+            for ptr_hash in self.record_pointer_hashes:
+                record_tlv.record_pointer_hashes.append(ptr_hash.encode())
+        else:
+            record_tlv.record_version = self.version
+            for ptr_hash in self.record_pointer_hashes:
+                record_tlv.record_pointer_digests.append(bytes.fromhex(ptr_hash))
+        record_tlv.log_event = self.log_event.encode()
+        self.wire = bytes(record_tlv.encode())
+        return self.wire
 
     def is_genesis_record(self) -> bool:
-        for i in range(len(self.record_name) - 1):
-            if (Component.to_str(self.record_name[i]) == "RECORD"):
-                return False
-            if (Component.to_str(self.record_name[i]) == "GENESIS_RECORD"):
-                return True
-        return False
+        return self.get_record_id().is_genesis
 
     # Print all info for debugging
     def print(self) -> None:
-        print("Record:\t" + Name.to_str(self.get_record_name()))
-        print("Link1:\t" + Name.to_str(self.record_pointers[0]))
-        print("Link1-hash:\t" + self.record_pointer_hashes[0])
-        print("Link2:\t" + Name.to_str(self.record_pointers[1]))
-        print("Link2-hash:\t" + self.record_pointer_hashes[1])
+        pointers = self.get_pointers_from_header()
+        pointer_hashes = self.get_pointer_hashes_from_header()
+        print("Record:\t" + self.get_record_name_str())
+        for i in range(len(pointers)):
+            print(f"Link{i + 1}:\t" + Name.to_str(pointers[i]))
+            print(f"Link{i + 1}-hash:\t" + pointer_hashes[i])
         print("Log event:\t" + self.get_log_event())
         print("Encoded:")
-        if (self.record_tlv is not None):
-            print(self.record_tlv.encode())
+        if (self.wire is not None):
+            print(bytes(self.wire))
         else:
             print(None)
         print('')
 
 class GenesisRecord(Record):
+    __slots__ = ()
+
     def __init__(self, number: int):
         super().__init__(record_name="/mnemosyne/GENESIS_RECORD/" + str(number))
         self.set_log_event("")
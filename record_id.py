@@ -0,0 +1,96 @@
+from typing import Dict
+from ndn.encoding import Name, Component, FormalName, NonStrictName
+
+RECORD_COMPONENT = Component.from_str("RECORD")
+GENESIS_RECORD_COMPONENT = Component.from_str("GENESIS_RECORD")
+
+# A record's name, parsed once per process.
+# A RecordId is the name's canonical string form (so it is used as is for
+# storage keys, dict and set keys, and wherever record names were strings),
+# with the parsed name, its encoding and its split into producer prefix and
+# event name cached alongside.
+# IDs are interned: from_name, from_str and from_wire return the same object
+# for the same name, so converting a name again is a dict lookup. Up to
+# MAX_INTERNED names are remembered; the table starts over when it's full.
+class RecordId(str):
+    MAX_INTERNED = 1 << 18
+    by_str: Dict[str, 'RecordId'] = {}
+    by_wire: Dict[bytes, 'RecordId'] = {}
+
+    def __new__(cls, name: FormalName, wire: bytes, name_str: str) -> 'RecordId':
+        record_id = super().__new__(cls, name_str)
+        record_id.name = name
+        record_id.wire = wire
+        # Components in the producer prefix of <producer prefix>/RECORD/<event name>
+        # or <producer prefix>/GENESIS_RECORD/<number>; None for other names.
+        record_id.producer_length = None
+        record_id.is_genesis = False
+        for i in range(len(name) - 1):
+            if (name[i] == RECORD_COMPONENT or name[i] == GENESIS_RECORD_COMPONENT):
+                record_id.producer_length = i
+                record_id.is_genesis = name[i] == GENESIS_RECORD_COMPONENT
+                break
+        record_id.producer_str = None
+        return record_id
+
+    def __reduce__(self):
+        return (RecordId.from_str, (str(self),))
+
+    @classmethod
+    def intern(cls, record_id: 'RecordId') -> 'RecordId':
+        if (len(cls.by_wire) >= cls.MAX_INTERNED):
+            cls.by_str.clear()
+            cls.by_wire.clear()
+        cls.by_str[record_id] = record_id
+        cls.by_wire[record_id.wire] = record_id
+        return record_id
+
+    @classmethod
+    def from_name(cls, name: NonStrictName) -> 'RecordId':
+        if (isinstance(name, RecordId)):
+            return name
+        if (isinstance(name, str)):
+            return cls.from_str(name)
+        wire = bytes(Name.to_bytes(name))
+        record_id = cls.by_wire.get(wire)
+        if (record_id is None):
+            name = Name.normalize(name)
+            record_id = cls.intern(cls(name, wire, Name.to_str(name)))
+        return record_id
+
+    @classmethod
+    def from_str(cls, name_str: str) -> 'RecordId':
+        record_id = cls.by_str.get(name_str)
+        if (record_id is None):
+            name = Name.from_str(name_str)
+            wire = bytes(Name.to_bytes(name))
+            record_id = cls.by_wire.get(wire) or cls.intern(cls(name, wire, Name.to_str(name)))
+            # Also remember the non-canonical spelling.
+            cls.by_str[name_str] = record_id
+        return record_id
+
+    # From an encoded name (Name TLV).
+    @classmethod
+    def from_wire(cls, wire) -> 'RecordId':
+        wire = bytes(wire)
+        record_id = cls.by_wire.get(wire)
+        if (record_id is None):
+            name = Name.from_bytes(wire)
+            record_id = cls.intern(cls(name, wire, Name.to_str(name)))
+        return record_id
+
+    # The name of the logger (or genesis) that made the record.
+    @property
+    def producer_name(self) -> FormalName:
+        return [] if self.producer_length is None else self.name[:self.producer_length]
+
+    @property
+    def producer(self) -> str:
+        if (self.producer_str is None):
+            self.producer_str = Name.to_str(self.producer_name)
+        return self.producer_str
+
+    # The <event name> in <producer prefix>/RECORD/<event name>.
+    @property
+    def event_name(self) -> FormalName:
+        return [] if self.producer_length is None else self.name[self.producer_length + 1:]
@@ -0,0 +1,207 @@
+import asyncio as aio
+import time
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Optional, Tuple
+from Cryptodome.Hash import SHA256
+from Cryptodome.PublicKey import ECC
+from Cryptodome.Signature import DSS
+# NDN Imports
+from ndn.app import NDNApp
+from ndn.encoding import Name, FormalName, NonStrictName, TlvModel, BytesField, ModelField, RepeatedField, Signer, parse_data
+from ndn.encoding.tlv_var import parse_tl_num
+from ndn.security.validator.known_key_validator import verify_ecdsa
+# Custom Imports
+from event_batch import merkle_root
+
+class SignatureTypes:
+    RECORD_SIGNATURE = 320
+    KEY_NAME = 321
+    SIGNED_RECORD_NAME = 322
+    SIGNED_RECORD_DIGEST = 323
+    SIGNATURE_VALUE = 324
+
+# A logger's signature over a window of its records, published to the records
+# group after them. It lists each record's name and digest and signs the
+# Merkle root of (name, digest) pairs, so one signature covers the whole window.
+class RecordSignatureTlv(TlvModel):
+    key_name = BytesField(SignatureTypes.KEY_NAME)
+    record_names = RepeatedField(BytesField(SignatureTypes.SIGNED_RECORD_NAME))
+    record_digests = RepeatedField(BytesField(SignatureTypes.SIGNED_RECORD_DIGEST))
+    signature_value = BytesField(SignatureTypes.SIGNATURE_VALUE)
+
+class RecordSignatureFrame(TlvModel):
+    signature = ModelField(SignatureTypes.RECORD_SIGNATURE, RecordSignatureTlv)
+
+# The bytes signed for a window of records.
+def signed_root(record_names: List[bytes], record_digests: List[bytes]) -> bytes:
+    return bytes.fromhex(merkle_root(
+        [bytes(name) + bytes(digest) for name, digest in zip(record_names, record_digests)]))
+
+# Whether data published to the records group is a signature rather than a record.
+def is_record_signature(content) -> bool:
+    try:
+        return parse_tl_num(content, 0)[0] == SignatureTypes.RECORD_SIGNATURE
+    except Exception:
+        return False
+
+def decode_record_signature(content) -> RecordSignatureTlv:
+    try:
+        signature = RecordSignatureFrame.parse(content).signature
+    except Exception:
+        signature = None
+    if (signature is None or signature.key_name is None or signature.signature_value is None
+            or len(signature.record_names) != len(signature.record_digests)):
+        raise RuntimeError('Malformed record signature.')
+    return signature
+
+# Check a batch of ECDSA signatures, each given as (public key DER, signed bytes,
+# signature). Runs in a worker process.
+def verify_signatures(batch: List[Tuple[bytes, bytes, bytes]]) -> List[bool]:
+    results = []
+    for key_der, signed, signature in batch:
+        try:
+            DSS.new(ECC.import_key(key_der), 'fips-186-3', 'der').verify(SHA256.new(signed), signature)
+            results.append(True)
+        except ValueError:
+            results.append(False)
+    return results
+
+# Signs this logger's records in windows of up to `window` records, and
+# publishes each signature with publish(). A partial window is signed once
+# its oldest record has waited max_delay seconds (see sign_if_due).
+class RecordSigner:
+    def __init__(self, signer: Signer, publish: Callable[[bytes], None],
+                 window: int = 1, max_delay: float = 1.0) -> None:
+        self.signer = signer
+        self.publish = publish
+        self.window = window
+        self.max_delay = max_delay
+        self.key_name: bytes = Name.to_bytes(signer.key_name)
+        self.record_names: List[bytes] = []
+        self.record_digests: List[bytes] = []
+        self.window_since: float = 0
+
+    def add(self, record_name: FormalName, record_digest: bytes) -> None:
+        if (not self.record_names):
+            self.window_since = time.monotonic()
+        self.record_names.append(Name.to_bytes(record_name))
+        self.record_digests.append(record_digest)
+        if (len(self.record_names) >= self.window):
+            self.sign()
+
+    def sign_if_due(self) -> None:
+        if (self.record_names and time.monotonic() - self.window_since >= self.max_delay):
+            self.sign()
+
+    def sign(self) -> None:
+        if (not self.record_names):
+            return
+        signature = RecordSignatureTlv()
+        signature.key_name = self.key_name
+        signature.record_names = self.record_names
+        signature.record_digests = self.record_digests
+        signature_value = bytearray(self.signer.get_signature_value_size())
+        size = self.signer.write_signature_value(
+            signature_value, [signed_root(self.record_names, self.record_digests)])
+        signature.signature_value = bytes(signature_value[:size])
+        frame = RecordSignatureFrame()
+        frame.signature = signature
+        self.record_names = []
+        self.record_digests = []
+        self.publish(bytes(frame.encode()))
+
+# Verifies record signatures against the trust schema and the trust anchor.
+# check(name, key_name) is the trust schema check (see security.py); its
+# results are cached per (name, key).
+# Keys are fetched as certificates and checked up to the trust anchor once,
+# then cached. Signatures that arrive together are checked as one batch in
+# the executor (e.g. a process pool; None uses the event loop's default).
+# Must be used from the event loop thread.
+class RecordVerifier:
+    def __init__(self, ndn_app: NDNApp, check: Callable[[FormalName, FormalName], bool],
+                 trust_anchor: bytes, executor: Optional[Executor] = None,
+                 max_chain: int = 4) -> None:
+        self.app = ndn_app
+        self.check = check
+        self.executor = executor
+        self.max_chain = max_chain
+        # {key name (bytes): public key (DER)}
+        self.verified_keys: Dict[bytes, bytes] = {}
+        self.key_fetches: Dict[bytes, aio.Future] = {}
+        self.schema_checks: Dict[Tuple[bytes, bytes], bool] = {}
+        # Signatures waiting to be checked in the next batch.
+        self.queued: List[Tuple[Tuple[bytes, bytes, bytes], aio.Future]] = []
+        anchor_name, _, anchor_key, _ = parse_data(trust_anchor)
+        self.verified_keys[Name.to_bytes(anchor_name[:-2])] = bytes(anchor_key)
+
+    def check_schema(self, name: FormalName, key_name: FormalName) -> bool:
+        cache_key = (Name.to_bytes(name), Name.to_bytes(key_name))
+        result = self.schema_checks.get(cache_key)
+        if (result is None):
+            result = self.schema_checks[cache_key] = bool(self.check(name, key_name))
+        return result
+
+    # Get a key's public key, or None if it can't be traced back to the trust anchor.
+    async def get_key(self, key_name: NonStrictName, depth: int = 0) -> Optional[bytes]:
+        key_name_bytes = Name.to_bytes(key_name)
+        if (key_name_bytes in self.verified_keys):
+            return self.verified_keys[key_name_bytes]
+        if (depth >= self.max_chain):
+            return None
+        fetch = self.key_fetches.get(key_name_bytes)
+        if (fetch is None):
+            fetch = self.key_fetches[key_name_bytes] = aio.ensure_future(
+                self.fetch_key(key_name, depth))
+        try:
+            return await aio.shield(fetch)
+        finally:
+            if (fetch.done()):
+                self.key_fetches.pop(key_name_bytes, None)
+
+    async def fetch_key(self, key_name: NonStrictName, depth: int) -> Optional[bytes]:
+        try:
+            _, _, _, cert = await self.app.express_interest(
+                key_name, must_be_fresh=False, can_be_prefix=True, need_raw_packet=True)
+            cert_name, _, key, sig_ptrs = parse_data(cert)
+            issuer = sig_ptrs.signature_info.key_locator.name
+        except Exception:
+            return None
+        if (not self.check_schema(cert_name, issuer)):
+            return None
+        issuer_key = await self.get_key(issuer, depth + 1)
+        if (issuer_key is None or not verify_ecdsa(ECC.import_key(issuer_key), sig_ptrs)):
+            return None
+        self.verified_keys[Name.to_bytes(key_name)] = bytes(key)
+        return self.verified_keys[Name.to_bytes(key_name)]
+
+    async def verify(self, signature: RecordSignatureTlv) -> bool:
+        key_name = Name.from_bytes(signature.key_name)
+        if (not signature.record_names):
+            return False
+        for record_name in signature.record_names:
+            if (not self.check_schema(Name.from_bytes(record_name), key_name)):
+                return False
+        return await self.verify_signed(
+            key_name, signed_root(signature.record_names, signature.record_digests),
+            signature.signature_value)
+
+    # Check a signature by key_name over signed.
+    async def verify_signed(self, key_name: NonStrictName, signed: bytes, signature_value) -> bool:
+        key = await self.get_key(key_name)
+        if (key is None):
+            return False
+        future = aio.get_event_loop().create_future()
+        self.queued.append(((key, bytes(signed), bytes(signature_value)), future))
+        if (len(self.queued) == 1):
+            aio.get_event_loop().call_soon(lambda: aio.ensure_future(self.verify_queued()))
+        return await future
+
+    async def verify_queued(self) -> None:
+        batch, self.queued = self.queued, []
+        try:
+            results = await aio.get_event_loop().run_in_executor(
+                self.executor, verify_signatures, [item for item, _ in batch])
+        except Exception:
+            results = [False] * len(batch)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
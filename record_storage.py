@@ -1,26 +1,445 @@
 import dbm
+import mmap
+import os
+import re
+import sqlite3
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
 from record import Record
+from tail_index import TailIndex
+from query import RecordIndex
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
-# Records are stored as {Name (str): encoded TLV packet}
-class RecordStorage:
-    # If another process is using the DB, wait for it to be done.
-    def get_db(self, db_name):
-        while True:
+# Retry fn with exponential backoff while the database is held by another process.
+def retry_with_backoff(fn: Callable, retry_on: tuple, timeout: float = 30.0,
+                       initial_delay: float = 0.001, max_delay: float = 0.5):
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    while True:
+        try:
+            return fn()
+        except retry_on:
+            if (time.monotonic() + delay > deadline):
+                raise RuntimeError('Timed out waiting for the record store to be released.')
+            time.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+# Take the store's lock file, so that other processes can't open the same
+# store at the same time; they wait with backoff instead.
+def lock_store(db_name: str):
+    if (fcntl is None):
+        return None
+    lock_file = open(db_name + '.lock', 'a')
+    retry_with_backoff(
+        lambda: fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB),
+        (BlockingIOError,))
+    return lock_file
+
+def unlock_store(lock_file) -> None:
+    if (lock_file is not None):
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+# Records are stored as {Name (str): encoded TLV packet} in a dbm file.
+# The file is opened once and kept open, under the store's lock file.
+# Read-only, the lock isn't taken, so a store can be read while its logger
+# runs; it then sees what the logger had committed when it was opened.
+class DbmBackend:
+    def __init__(self, db_name: str, read_only: bool = False):
+        self.db_name = db_name
+        self.lock_file = None if read_only else lock_store(db_name)
+        self.db = retry_with_backoff(lambda: dbm.open(db_name, 'r' if read_only else 'c'), dbm.error)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.db.get(key)
+
+    def put_many(self, items: Iterable[Tuple[str, bytes]]) -> None:
+        for key, value in items:
+            self.db[key] = value
+
+    def items(self) -> Iterator[Tuple[str, bytes]]:
+        for key in self.db.keys():
+            yield key.decode(), self.db[key]
+
+    # Write out buffered data and indexes to the OS.
+    def commit(self) -> None:
+        if (hasattr(self.db, 'sync')):
+            self.db.sync()
+
+    # Force committed data to disk.
+    def sync(self) -> None:
+        for suffix in ('', '.db', '.dat', '.dir'):
+            path = self.db_name + suffix
+            if (os.path.isfile(path)):
+                fd = os.open(path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+
+    def close(self) -> None:
+        self.db.close()
+        unlock_store(self.lock_file)
+
+# Records are stored as rows of (name, encoded TLV packet) in an SQLite database
+# in WAL mode, which lets readers in other processes run alongside the writer.
+class SqliteBackend:
+    def __init__(self, db_name: str, read_only: bool = False):
+        connect = self.connect_read_only if read_only else self.connect
+        self.conn = retry_with_backoff(
+            lambda: connect(db_name + '.sqlite'), (sqlite3.OperationalError,))
+
+    def connect_read_only(self, path: str) -> sqlite3.Connection:
+        return sqlite3.connect(f'file:{path}?mode=ro', uri=True, timeout=30.0, check_same_thread=False)
+
+    def connect(self, path: str) -> sqlite3.Connection:
+        # The connection may be used from a logger's record worker thread,
+        # though never from two threads at once.
+        conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # Commits only reach the WAL; sync() checkpoints it to make them durable.
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS records (name TEXT PRIMARY KEY, data BLOB NOT NULL)')
+        conn.commit()
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        row = self.conn.execute('SELECT data FROM records WHERE name = ?', (key,)).fetchone()
+        if (row is None):
+            return None
+        return row[0]
+
+    def put_many(self, items: Iterable[Tuple[str, bytes]]) -> None:
+        self.conn.executemany('INSERT OR REPLACE INTO records (name, data) VALUES (?, ?)', items)
+
+    def items(self) -> Iterator[Tuple[str, bytes]]:
+        yield from self.conn.execute('SELECT name, data FROM records')
+
+    def commit(self) -> None:
+        self.conn.commit()
+
+    def sync(self) -> None:
+        self.conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+    def close(self) -> None:
+        self.conn.close()
+
+# Records are appended to rolling segment files, <db_name>.<n>.seg, as entries of
+# (name length, record length, CRC-32 of both, name, encoded TLV packet).
+# Segments are memory-mapped and records are read back without copying, as
+# memoryviews of the mapping. An in-memory {name: (segment, offset, length)}
+# index is rebuilt from the entry headers when the store is opened; storing a
+# record again appends it again, and the index points to the newest copy.
+# The segment being written is preallocated to segment_size bytes; once full
+# it is trimmed and forced to disk, and the next segment is started. After a
+# crash, only the last segment has to be checked: it is scanned up to the
+# first incomplete or corrupt entry, and anything after that is dropped.
+# Read-only, the lock isn't taken and nothing is written or truncated, so a
+# store can be read while its logger runs; the last segment is then read up
+# to the last complete entry the logger had written when it was opened.
+class SegmentBackend:
+    HEADER = struct.Struct('>III')
+
+    def __init__(self, db_name: str, read_only: bool = False, segment_size: int = 16 * 1024 * 1024):
+        self.db_name = db_name
+        self.segment_size = segment_size
+        self.read_only = read_only
+        self.lock_file = None if read_only else lock_store(db_name)
+        self.index: Dict[str, Tuple[int, int, int]] = {}
+        # {segment number: memory map}
+        self.maps: Dict[int, mmap.mmap] = {}
+        directory = os.path.dirname(db_name) or '.'
+        pattern = re.compile(re.escape(os.path.basename(db_name)) + r'\.(\d+)\.seg')
+        segments = sorted(int(match.group(1)) for match in map(pattern.fullmatch, os.listdir(directory))
+                          if match is not None)
+        for segment in segments[:-1]:
+            self.scan(segment, False)
+        if (read_only):
+            if (segments):
+                self.scan(segments[-1], True)
+            self.file = None
+            self.segment = -1
+            return
+        self.segment = segments[-1] if segments else 0
+        end = self.scan(self.segment, True) if segments else 0
+        self.open_segment(self.segment, end)
+
+    def segment_path(self, segment: int) -> str:
+        return f'{self.db_name}.{segment:06d}.seg'
+
+    # Index a segment's entries, and return where its last complete entry ends.
+    # With check, stop at the first entry whose checksum doesn't match.
+    def scan(self, segment: int, check: bool) -> int:
+        path = self.segment_path(segment)
+        size = os.path.getsize(path)
+        if (size == 0):
+            return 0
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        offset = 0
+        try:
+            while (offset + self.HEADER.size <= size):
+                name_length, data_length, checksum = self.HEADER.unpack_from(data, offset)
+                start = offset + self.HEADER.size
+                end = start + name_length + data_length
+                if (name_length == 0 or end > size):
+                    break
+                if (check and zlib.crc32(data[start:end]) != checksum):
+                    break
+                self.index[data[start:start + name_length].decode()] = (
+                    segment, start + name_length, data_length)
+                offset = end
+        finally:
+            data.close()
+        return offset
+
+    # Start writing to a segment at end: drop anything after it, preallocate
+    # the segment and map it.
+    def open_segment(self, segment: int, end: int, min_capacity: int = 0) -> None:
+        path = self.segment_path(segment)
+        self.file = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+        self.file.truncate(end)
+        self.capacity = max(self.segment_size, end, min_capacity)
+        self.file.truncate(self.capacity)
+        self.file.seek(end)
+        self.segment = segment
+        self.end = end
+        self.committed = end
+        self.maps[segment] = mmap.mmap(self.file.fileno(), self.capacity, access=mmap.ACCESS_READ)
+
+    # Trim the full segment, force it to disk and start the next one.
+    def roll(self, min_capacity: int) -> None:
+        self.file.flush()
+        self.file.truncate(self.end)
+        os.fsync(self.file.fileno())
+        self.file.close()
+        if (self.end == 0):
+            # Nothing written to it yet; grow it instead.
+            self.maps.pop(self.segment).close()
+            self.open_segment(self.segment, 0, min_capacity)
+        else:
+            self.open_segment(self.segment + 1, 0, min_capacity)
+
+    def get_map(self, segment: int) -> mmap.mmap:
+        data = self.maps.get(segment)
+        if (data is None):
+            with open(self.segment_path(segment), 'rb') as f:
+                data = self.maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return data
+
+    def get(self, key: str) -> Optional[memoryview]:
+        location = self.index.get(key)
+        if (location is None):
+            return None
+        segment, offset, length = location
+        if (segment == self.segment and offset + length > self.committed):
+            self.commit()
+        return memoryview(self.get_map(segment))[offset:offset + length]
+
+    def put_many(self, items: Iterable[Tuple[str, bytes]]) -> None:
+        for key, value in items:
+            # Plain strings, so that the index doesn't keep RecordIds' parsed names alive.
+            key = str(key)
+            name = key.encode()
+            size = self.HEADER.size + len(name) + len(value)
+            if (self.end + size > self.capacity):
+                self.roll(size)
+            self.file.write(self.HEADER.pack(len(name), len(value), zlib.crc32(value, zlib.crc32(name))))
+            self.file.write(name)
+            self.file.write(value)
+            self.index[key] = (self.segment, self.end + self.HEADER.size + len(name), len(value))
+            self.end += size
+
+    def items(self) -> Iterator[Tuple[str, bytes]]:
+        for key, (segment, offset, length) in self.index.items():
+            yield key, self.get_map(segment)[offset:offset + length]
+
+    def commit(self) -> None:
+        self.file.flush()
+        self.committed = self.end
+
+    def sync(self) -> None:
+        os.fsync(self.file.fileno())
+
+    def close(self) -> None:
+        if (self.file is not None):
+            self.file.flush()
+            self.file.truncate(self.end)
+            os.fsync(self.file.fileno())
+            self.file.close()
+        for data in self.maps.values():
             try:
-                db = dbm.open(db_name, 'c')
-                return db
-            except:
+                data.close()
+            except BufferError:
+                # Records read from it are still in use; the mapping is
+                # released once they are gone.
                 pass
+        unlock_store(self.lock_file)
+
+# Records are stored as {Name (str): encoded TLV packet}
+# The backing store stays open for the life of the RecordStorage object.
+# "dbm" is the most portable; "sqlite" allows faster concurrent access;
+# "segment" appends records to memory-mapped segment files, for the fastest
+# ingest and reads.
+#
+# Writes go to an in-memory buffer first and are written to the backend as a
+# single group commit once batch_size records are buffered, flush_interval ms
+# have passed since the oldest buffered write, or the store is closed.
+# Reads see buffered records. sync_interval sets durability: 0 forces the
+# data to disk on every commit; otherwise it is forced at most every
+# sync_interval ms, trading crash-safety for ingest throughput.
+#
+# Up to cache_size decoded records are kept in an LRU cache so that repeated
+# lookups don't parse the TLV again. Cached records are frozen, since they are
+# shared between callers.
+#
+# The DAG's current tails (validated records nothing points to yet) are kept
+# in a TailIndex, selected from with tail_policy; see tail_index.py.
+#
+# With read_only, the store is opened for reading only (see the backends),
+# e.g. to audit a running logger's store, and storing records raises.
+#
+# With index, committed records are also added to a RecordIndex
+# (<db_name>_index.sqlite) for queries by logger, producer, event and links;
+# see query.py.
+class RecordStorage:
+    BACKENDS = {
+        'dbm': DbmBackend,
+        'sqlite': SqliteBackend,
+        'segment': SegmentBackend,
+    }
+
+    def __init__(self, backend: str = 'dbm', db_name: str = 'record_store',
+                 batch_size: int = 64, flush_interval: int = 50, sync_interval: int = 1000,
+                 cache_size: int = 4096, tail_policy: str = 'random', max_tails: int = 1024,
+                 index: bool = False, read_only: bool = False):
+        if (backend not in self.BACKENDS):
+            raise RuntimeError('Unknown record store backend: ' + backend)
+        self.db_name = db_name
+        self.read_only = read_only
+        self.backend = self.BACKENDS[backend](db_name, read_only)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval / 1000
+        self.sync_interval = sync_interval / 1000
+        # Records written but not yet committed to the backend.
+        self.pending: Dict[str, bytes] = {}
+        self.pending_since: float = 0
+        self.last_sync: float = time.monotonic()
+        # Whether some commits haven't been forced to disk yet.
+        self.unsynced: bool = False
+        # Decoded records, least recently used first.
+        self.cache: OrderedDict = OrderedDict()
+        self.cache_size = cache_size
+        self.cache_hits: int = 0
+        self.cache_misses: int = 0
+        self.cache_evictions: int = 0
+        self.tails = TailIndex(tail_policy, max_tails)
+        self.index: Optional[RecordIndex] = RecordIndex(db_name + '_index') if index else None
 
     def store_record(self, record_name: str, encoded_record: bytearray):
-        db = self.get_db('record_store')
-        db[record_name] = bytes(encoded_record)
-        db.close()
+        self.store_records([(record_name, encoded_record)])
+
+    # Store several records as part of the same group commit.
+    def store_records(self, batch: Iterable[Tuple[str, bytearray]]) -> None:
+        if (self.read_only):
+            raise RuntimeError('The record store is open read-only.')
+        if (not self.pending):
+            self.pending_since = time.monotonic()
+        for record_name, encoded_record in batch:
+            self.pending[record_name] = bytes(encoded_record)
+            self.cache.pop(record_name, None)
+        self.flush_if_due()
 
     def get_record(self, record_name):
-        db = self.get_db('record_store')
-        ret = None
-        if record_name in db:
-            ret = Record(data=db[record_name])
-        db.close()
-        return ret
+        record = self.cache.get(record_name)
+        if (record is not None):
+            self.cache_hits += 1
+            self.cache.move_to_end(record_name)
+            return record
+        self.cache_misses += 1
+        data = self.pending.get(record_name)
+        if (data is None):
+            data = self.backend.get(record_name)
+        if (data is None):
+            return None
+        record = Record(data=data)
+        record.freeze()
+        if (self.cache_size > 0):
+            self.cache[record_name] = record
+            if (len(self.cache) > self.cache_size):
+                self.cache.popitem(last=False)
+                self.cache_evictions += 1
+        return record
+
+    def get_cache_stats(self) -> dict:
+        return {
+            'size': len(self.cache),
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'evictions': self.cache_evictions,
+        }
+
+    # Iterate over every stored record as (name, encoded TLV packet), without decoding.
+    def iter_encoded_records(self) -> Iterator[Tuple[str, bytes]]:
+        pending = dict(self.pending)
+        yield from pending.items()
+        for record_name, encoded_record in self.backend.items():
+            if (record_name not in pending):
+                yield record_name, encoded_record
+
+    # Size of the store's files on disk. Where the OS reports it, this is the
+    # space actually allocated, so preallocated segments only count what's used.
+    def get_size_bytes(self) -> int:
+        directory = os.path.dirname(self.db_name) or '.'
+        base = os.path.basename(self.db_name)
+        size = 0
+        for file_name in os.listdir(directory):
+            if (file_name == base or file_name.startswith(base + '.')):
+                stat = os.stat(os.path.join(directory, file_name))
+                size += stat.st_blocks * 512 if hasattr(stat, 'st_blocks') else stat.st_size
+        return size
+
+    def has_record(self, record_name) -> bool:
+        return (record_name in self.cache
+                or record_name in self.pending
+                or self.backend.get(record_name) is not None)
+
+    # Commit buffered writes if the buffer is full or old enough,
+    # or force earlier commits to disk if they have waited long enough.
+    def flush_if_due(self) -> None:
+        now = time.monotonic()
+        if (len(self.pending) >= self.batch_size
+                or (self.pending and now - self.pending_since >= self.flush_interval)
+                or (self.unsynced and now - self.last_sync >= self.sync_interval)):
+            self.flush()
+
+    # Commit all buffered writes, and force them to disk if the durability
+    # level requires it (or always, with sync).
+    def flush(self, sync: bool = False) -> None:
+        if (self.pending):
+            self.backend.put_many(self.pending.items())
+            self.backend.commit()
+            if (self.index is not None):
+                self.index.add_records(self.pending.items())
+            self.pending = {}
+            self.unsynced = True
+        now = time.monotonic()
+        if (self.unsynced and (sync or now - self.last_sync >= self.sync_interval)):
+            self.backend.sync()
+            self.last_sync = now
+            self.unsynced = False
+
+    def close(self) -> None:
+        self.flush()
+        if (self.unsynced):
+            self.backend.sync()
+        self.backend.close()
+        if (self.index is not None):
+            self.index.close()
@@ -0,0 +1,68 @@
+import asyncio as aio
+import queue
+import threading
+from typing import Callable
+
+# Runs the logger's record processing (storage I/O, validation, hashing) on a
+# dedicated thread, so the asyncio event loop stays free to answer SVS sync
+# interests and fetches.
+# Jobs run one at a time in the order they were submitted. Submitting never
+# blocks; instead, wait_for_capacity() lets producers such as the fetch
+# scheduler wait while more than max_queued jobs are waiting, and resumes them
+# once the queue drains to half that.
+# While a job runs, the event loop only gets the interpreter when the worker
+# thread gives up the GIL (see consumer.py's --switch-interval); long calls
+# into C code that hold it keep the event loop waiting.
+class RecordWorker:
+    def __init__(self, loop: aio.AbstractEventLoop, max_queued: int = 1024) -> None:
+        self.loop = loop
+        self.max_queued = max_queued
+        self.jobs: queue.SimpleQueue = queue.SimpleQueue()
+        # Jobs submitted but not finished. Only changed on the event loop thread.
+        self.num_queued: int = 0
+        self.has_capacity = aio.Event()
+        self.has_capacity.set()
+        self.thread = threading.Thread(target=self.run, name="record-worker", daemon=True)
+        self.thread.start()
+
+    # Queue fn(*args) to run on the worker thread. Call from the event loop thread.
+    def submit(self, fn: Callable, *args) -> None:
+        self.num_queued += 1
+        if (self.num_queued >= self.max_queued):
+            self.has_capacity.clear()
+        self.jobs.put((fn, args))
+
+    # Wait until the worker isn't overloaded.
+    async def wait_for_capacity(self) -> None:
+        await self.has_capacity.wait()
+
+    # Run fn(*args) on the event loop thread. Call from jobs, for anything
+    # that isn't thread-safe (e.g. SVS and scheduling asyncio tasks).
+    def call_on_loop(self, fn: Callable, *args) -> None:
+        self.loop.call_soon_threadsafe(fn, *args)
+
+    def run(self) -> None:
+        while True:
+            job = self.jobs.get()
+            if (job is None):
+                return
+            fn, args = job
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f'Error: record worker job {getattr(fn, "__name__", fn)} failed: {e}')
+            try:
+                self.loop.call_soon_threadsafe(self.job_done)
+            except RuntimeError:
+                # The event loop is already closed.
+                pass
+
+    def job_done(self) -> None:
+        self.num_queued -= 1
+        if (self.num_queued <= self.max_queued // 2):
+            self.has_capacity.set()
+
+    # Finish the queued jobs and stop the thread.
+    def close(self) -> None:
+        self.jobs.put(None)
+        self.thread.join()
@@ -29,6 +29,8 @@ lvs_text = r'''
 # app = NDNApp(keychain=keychain)
 # validator = lvs_validator(checker, app, trust_anchor.data)
 
+# Compiling the schema is slow, so one Security object is shared by every
+# logger in the process (see get_security).
 class Security:
     def __init__(self):
         self.lvs_model = compile_lvs(lvs_text)
@@ -36,3 +38,11 @@ class Security:
     
     def check_sig(self, data_name: str, key_name: str) -> bool:
         return self.checker.check(data_name, key_name)
+
+shared_security = None
+
+def get_security() -> Security:
+    global shared_security
+    if (shared_security is None):
+        shared_security = Security()
+    return shared_security
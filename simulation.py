@@ -0,0 +1,573 @@
+import asyncio as aio
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import selectors
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser, SUPPRESS
+from typing import Callable, Dict, List, Optional, Set
+# NDN Imports
+from ndn.encoding import Name, Component, FormalName
+# Custom Imports
+sys.path.insert(0,'.')
+from ndn.svs import MissingData
+from consumer import Logger
+from producer import Program
+from record import Record
+from record_signing import is_record_signature
+
+# Runs loggers and the producer in one process, over a simulated network
+# instead of NFD, on virtual time: no real time passes while the simulated
+# nodes wait, so a scenario of many minutes runs as fast as the loggers can
+# process it, and a run is repeatable for the same seed.
+
+def parse_cmd_args() -> dict:
+    # Command Line Parser
+    parser = ArgumentParser(add_help=False,description="Run loggers and the producer over a simulated network.")
+    optionalArgs = parser.add_argument_group("optional arguments")
+    informationArgs = parser.add_argument_group("information arguments")
+    # Adding all Command Line Arguments
+    optionalArgs.add_argument("-l","--loggers",action="store",dest="loggers",type=int,default=3,required=False,help="number of loggers (default: 3)")
+    optionalArgs.add_argument("-e","--events",action="store",dest="events",type=int,default=200,required=False,help="log events the producer publishes (default: 200)")
+    optionalArgs.add_argument("--event-interval",action="store",dest="event_interval",type=int,default=100,required=False,help="ms between log events (default: 100)")
+    optionalArgs.add_argument("--latency",action="store",dest="latency",type=float,default=10,required=False,help="one-way network latency in ms (default: 10)")
+    optionalArgs.add_argument("--jitter",action="store",dest="jitter",type=float,default=5,required=False,help="random extra latency of up to this many ms (default: 5)")
+    optionalArgs.add_argument("--loss",action="store",dest="loss",type=float,default=0,required=False,help="fraction of packets lost (default: 0)")
+    optionalArgs.add_argument("--reorder",action="store",dest="reorder",type=float,default=0,required=False,help="fraction of packets delayed by up to --reorder-delay more, so they arrive out of order (default: 0)")
+    optionalArgs.add_argument("--reorder-delay",action="store",dest="reorder_delay",type=float,default=200,required=False,help="max extra delay of reordered packets in ms (default: 200)")
+    optionalArgs.add_argument("--partition",action="append",dest="partitions",default=[],required=False,help="START:END:GROUPS, cut the network into GROUPS from START to END seconds, e.g. 5:15:p,0|1,2 (p is the producer, numbers are loggers, unlisted nodes form one more group); may be repeated")
+    optionalArgs.add_argument("--late-loggers",action="store",dest="late_loggers",type=int,default=0,required=False,help="number of loggers that only start at --join-at, and catch up on the history (default: 0)")
+    optionalArgs.add_argument("--join-at",action="store",dest="join_at",type=float,default=10,required=False,help="seconds after which the late loggers start (default: 10)")
+    optionalArgs.add_argument("--sync-interval",action="store",dest="sync_interval",type=float,default=30,required=False,help="seconds between each node's periodic sync interests (default: 30)")
+    optionalArgs.add_argument("--max-time",action="store",dest="max_time",type=float,default=600,required=False,help="give up on convergence after this many simulated seconds (default: 600)")
+    optionalArgs.add_argument("-s","--store",action="store",dest="store",default="dbm",choices=["dbm","sqlite","segment"],required=False,help="record store backend (default: dbm)")
+    optionalArgs.add_argument("--tail-policy",action="store",dest="tail_policy",default="random",choices=["random","oldest","cross-logger"],required=False,help="how loggers pick the tails their records point to (default: random)")
+    optionalArgs.add_argument("--seed",action="store",dest="seed",type=int,default=1,required=False,help="random seed (default: 1)")
+    optionalArgs.add_argument("--tracemalloc",action="store_true",dest="tracemalloc",default=False,required=False,help="measure the memory each logger allocates and keeps (slows down the run)")
+    optionalArgs.add_argument("-o","--output",action="store",dest="output",default=None,required=False,help="write results to this JSON file")
+    informationArgs.add_argument("-h","--help",action="help",default=SUPPRESS,help="show this help message and exit")
+    # Getting all Arguments
+    argvars = parser.parse_args()
+    args = vars(argvars)
+    if (args["late_loggers"] >= args["loggers"]):
+        parser.error("--late-loggers must be less than --loggers")
+    args["partitions"] = [parse_partition(spec) for spec in args["partitions"]]
+    return args
+
+# START:END:GROUPS, with the groups separated by | and their nodes by commas.
+def parse_partition(spec: str) -> 'Partition':
+    try:
+        start, end, groups = spec.split(":", 2)
+        return Partition(float(start), float(end), [
+            set(PRODUCER_ID if (node == "p") else logger_id(int(node)) for node in group.split(","))
+            for group in groups.split("|")])
+    except ValueError:
+        raise RuntimeError(f'invalid partition: {spec}')
+
+PRODUCER_ID = "/producer_1"
+RECORDS_GROUP = "/svs/mnemosyne/records"
+
+def logger_id(i: int) -> str:
+    return "/logger" + str(i)
+
+# Selector for an event loop that runs on virtual time: instead of waiting for
+# I/O, select() moves the clock to the next scheduled callback.
+# The loop can't do real I/O or take callbacks from other threads.
+class VirtualSelector(selectors.BaseSelector):
+    def __init__(self) -> None:
+        self.now: float = 0.0
+        self.keys: Dict[object, selectors.SelectorKey] = {}
+
+    def register(self, fileobj, events, data=None) -> selectors.SelectorKey:
+        fd = fileobj if isinstance(fileobj, int) else fileobj.fileno()
+        key = selectors.SelectorKey(fileobj, fd, events, data)
+        self.keys[fileobj] = key
+        return key
+
+    def unregister(self, fileobj) -> selectors.SelectorKey:
+        return self.keys.pop(fileobj)
+
+    def select(self, timeout=None) -> list:
+        if (timeout is None):
+            raise RuntimeError('the simulation is stuck: nothing is scheduled')
+        if (timeout <= 0):
+            return []
+        # Always move forward, even by less than the clock's resolution.
+        now = self.now + timeout
+        self.now = now if (now > self.now) else math.nextafter(self.now, math.inf)
+        return []
+
+    def get_map(self):
+        return self.keys
+
+class VirtualTimeLoop(aio.SelectorEventLoop):
+    def __init__(self) -> None:
+        self.virtual_selector = VirtualSelector()
+        super().__init__(self.virtual_selector)
+
+    def time(self) -> float:
+        return self.virtual_selector.now
+
+# A time span in which only nodes in the same group can reach each other.
+class Partition:
+    def __init__(self, start: float, end: float, groups: List[Set[str]]) -> None:
+        self.start = start
+        self.end = end
+        self.groups = groups
+
+    def group_of(self, nid: str) -> int:
+        for i, group in enumerate(self.groups):
+            if (nid in group):
+                return i
+        return -1
+
+    def separates(self, now: float, a: str, b: str) -> bool:
+        return self.start <= now < self.end and self.group_of(a) != self.group_of(b)
+
+# The network between the simulated SVSync nodes. Each packet is lost with
+# probability loss, or arrives after latency plus up to jitter seconds, and
+# with probability reorder up to reorder_delay seconds later still, so it may
+# overtake or be overtaken by other packets. Nodes separated by a partition
+# can't reach each other. There is no in-network caching: data is only
+# fetched from the node that published it.
+# on_publish(svs, seqno, data) is called for every publication.
+class SimNetwork:
+    def __init__(self, loop: aio.AbstractEventLoop, rng: random.Random,
+                 latency: float = 0.01, jitter: float = 0.0, loss: float = 0.0,
+                 reorder: float = 0.0, reorder_delay: float = 0.2,
+                 partitions: List[Partition] = None, sync_interval: float = 30,
+                 on_publish: Callable = None) -> None:
+        self.loop = loop
+        self.rng = rng
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.reorder = reorder
+        self.reorder_delay = reorder_delay
+        self.partitions = partitions or []
+        self.sync_interval = sync_interval
+        self.on_publish = on_publish
+        # Per group prefix: {node id: node}.
+        self.groups: Dict[str, Dict[str, 'SimSVSync']] = {}
+        self.packets_sent: int = 0
+        self.packets_lost: int = 0
+
+    def join(self, svs: 'SimSVSync') -> None:
+        self.groups.setdefault(svs.group, {})[svs.nid_str] = svs
+        self.loop.call_later(self.next_sync_delay(), self.sync_periodically, svs)
+
+    def next_sync_delay(self) -> float:
+        return self.sync_interval * self.rng.uniform(0.9, 1.1)
+
+    def sync_periodically(self, svs: 'SimSVSync') -> None:
+        svs.send_sync()
+        self.loop.call_later(self.next_sync_delay(), self.sync_periodically, svs)
+
+    def reachable(self, a: str, b: str) -> bool:
+        now = self.loop.time()
+        return not any(p.separates(now, a, b) for p in self.partitions)
+
+    # The delay of one packet from a to b, or None if it is lost.
+    def link_delay(self, a: str, b: str) -> Optional[float]:
+        self.packets_sent += 1
+        if (not self.reachable(a, b) or self.rng.random() < self.loss):
+            self.packets_lost += 1
+            return None
+        delay = self.latency + self.rng.uniform(0, self.jitter)
+        if (self.rng.random() < self.reorder):
+            delay += self.rng.uniform(0, self.reorder_delay)
+        return delay
+
+    # Send a node's state vector to the other nodes in its group.
+    def multicast_sync(self, sender: 'SimSVSync', state: Dict[str, int]) -> None:
+        for nid, svs in self.groups[sender.group].items():
+            if (svs is sender):
+                continue
+            delay = self.link_delay(sender.nid_str, nid)
+            if (delay is not None):
+                self.loop.call_later(delay, svs.on_sync, state)
+
+    # An interest for a node's data and the data coming back. Like an
+    # interest that times out, a lost one returns None after the interest lifetime.
+    async def fetch(self, requester: 'SimSVSync', nid: str, seqno: int) -> Optional[bytes]:
+        owner = self.groups[requester.group].get(nid)
+        content = owner.storage.get(seqno) if (owner is not None) else None
+        there = self.link_delay(requester.nid_str, nid)
+        back = self.link_delay(nid, requester.nid_str) if (there is not None) else None
+        if (content is None or back is None):
+            await aio.sleep(SimSVSync.DATA_INTEREST_LIFETIME / 1000)
+            return None
+        await aio.sleep(there + back)
+        return content
+
+# Stand-in for NDNApp: the simulated network the node is attached to.
+class SimApp:
+    def __init__(self, network: SimNetwork) -> None:
+        self.network = network
+
+class SimStateTable:
+    def __init__(self) -> None:
+        # {node id: latest seqno}
+        self.table: Dict[str, int] = {}
+
+    def getSeqno(self, nid) -> Optional[int]:
+        return self.table.get(Name.to_str(nid))
+
+class SimSVSyncCore:
+    def __init__(self, svs: 'SimSVSync') -> None:
+        self.svs = svs
+        self.table = SimStateTable()
+
+    def getSeqno(self) -> int:
+        return self.table.table.get(self.svs.nid_str, 0)
+
+    # Like SVS, a new state is announced right away.
+    def updateMyState(self, seqno: int) -> None:
+        self.table.table[self.svs.nid_str] = seqno
+        self.svs.send_sync()
+
+    def getStateTable(self) -> SimStateTable:
+        return self.table
+
+# Stand-in for SVSync over a SimNetwork, with the same data names.
+# Publishing announces the node's new state to the group; nodes also announce
+# their state every sync interval, and answer a state that is behind theirs
+# with their own, once, after a brief random delay (so that a burst of stale
+# states gets one answer, which has everything learnt in the meantime). Newer sequence numbers learnt this way are passed to the
+# update callback as MissingData, and fetched with fetchData.
+class SimSVSync:
+    DATA_INTEREST_LIFETIME = 2000
+    BRIEF_INTERVAL = 200
+    BRIEF_INTERVAL_RANDOMNESS = 0.5
+
+    def __init__(self, app: SimApp, group_prefix: FormalName, nid: FormalName, update_callback: Callable) -> None:
+        self.network = app.network
+        self.group_prefix = group_prefix
+        self.group = Name.to_str(group_prefix)
+        self.nid = nid
+        self.nid_str = Name.to_str(nid)
+        self.update_callback = update_callback
+        self.core = SimSVSyncCore(self)
+        # {seqno: data}
+        self.storage: Dict[int, bytes] = {}
+        self.reply_scheduled: bool = False
+        self.network.join(self)
+
+    def publishData(self, data: bytes) -> None:
+        seqno = self.core.getSeqno() + 1
+        self.storage[seqno] = bytes(data)
+        if (self.network.on_publish is not None):
+            self.network.on_publish(self, seqno, self.storage[seqno])
+        self.core.updateMyState(seqno)
+
+    async def fetchData(self, nid, seqno: int, retries: int = 0) -> Optional[bytes]:
+        for _ in range(retries + 1):
+            content = await self.network.fetch(self, Name.to_str(nid), seqno)
+            if (content is not None):
+                return content
+        return None
+
+    def getDataName(self, nid, seqno: int) -> FormalName:
+        return Name.normalize(nid) + self.group_prefix + [Component.from_str("data"), Component.from_str(str(seqno))]
+
+    def getCore(self) -> SimSVSyncCore:
+        return self.core
+
+    def send_sync(self) -> None:
+        self.network.multicast_sync(self, dict(self.core.table.table))
+
+    def send_reply(self) -> None:
+        self.reply_scheduled = False
+        self.send_sync()
+
+    def on_sync(self, state: Dict[str, int]) -> None:
+        table = self.core.table.table
+        missing = []
+        for nid, seqno in state.items():
+            if (table.get(nid, 0) < seqno):
+                missing.append(MissingData(nid, table.get(nid, 0) + 1, seqno))
+                table[nid] = seqno
+        if (not self.reply_scheduled and any(seqno > state.get(nid, 0) for nid, seqno in table.items())):
+            self.reply_scheduled = True
+            self.network.loop.call_later(
+                self.BRIEF_INTERVAL / 1000 * self.network.rng.uniform(
+                    1 - self.BRIEF_INTERVAL_RANDOMNESS, 1 + self.BRIEF_INTERVAL_RANDOMNESS),
+                self.send_reply)
+        if (missing):
+            self.update_callback(missing)
+
+def percentiles(values: List[float]) -> dict:
+    values = sorted(values)
+    def percentile(p: float) -> Optional[float]:
+        return values[min(len(values) - 1, int(p * len(values)))] if values else None
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values) if values else None,
+        'p50': percentile(0.5),
+        'p99': percentile(0.99),
+        'max': values[-1] if values else None,
+    }
+
+# One logger in a scenario, and what was measured about it.
+class SimLogger:
+    def __init__(self, i: int, logger: Logger, started: float) -> None:
+        self.i = i
+        self.logger = logger
+        self.started = started
+        # Records this logger has, created or received.
+        self.records: Set[str] = set()
+        # Seconds from a log event's publication to this logger's record of it.
+        self.create_latencies: List[float] = []
+        # Seconds from a record's creation to this logger receiving it.
+        self.receive_latencies: List[float] = []
+        self.orphan_samples: List[int] = []
+        self.cpu_seconds: float = 0
+        self.memory_bytes: int = 0
+        self.errors: int = 0
+
+# A record and when it reached the loggers.
+class RecordTiming:
+    def __init__(self, event_time: Optional[float], created: float, required: int) -> None:
+        self.event_time = event_time
+        self.created = created
+        # How many loggers running when it was created still need it.
+        self.required = required
+        self.committed: Optional[float] = None
+
+# N loggers and the producer over a SimNetwork.
+# A record is committed once every logger that was running when it was
+# created has it. The loggers have converged once the producer is done and
+# every logger has every record, with no orphans left.
+class Scenario:
+    SAMPLE_INTERVAL = 0.1
+
+    def __init__(self, args: dict, workdir: str) -> None:
+        self.args = args
+        self.workdir = workdir
+        self.loop = aio.get_event_loop()
+        self.network = SimNetwork(
+            self.loop, random.Random(args["seed"]),
+            latency=args["latency"] / 1000, jitter=args["jitter"] / 1000,
+            loss=args["loss"], reorder=args["reorder"], reorder_delay=args["reorder_delay"] / 1000,
+            partitions=args["partitions"], sync_interval=args["sync_interval"],
+            on_publish=self.on_publish)
+        self.app = SimApp(self.network)
+        self.loggers: List[SimLogger] = []
+        self.by_nid: Dict[str, SimLogger] = {}
+        self.tasks: List[aio.Future] = []
+        # {event name: publication time}
+        self.events: Dict[str, float] = {}
+        self.last_event_time: Optional[float] = None
+        self.timings: Dict[str, RecordTiming] = {}
+
+    def start_logger(self, i: int) -> None:
+        logger = Logger({
+            "node_id": logger_id(i),
+            "store": self.args["store"],
+            "store_path": os.path.join(self.workdir, "record_store_logger" + str(i)),
+            "tail_policy": self.args["tail_policy"],
+            "quiet": True,
+        }, ndn_app=self.app, svs_class=SimSVSync)
+        sim_logger = SimLogger(i, logger, self.loop.time())
+        for fetcher in (logger.log_events_fetcher, logger.records_fetcher):
+            fetcher.deliver = self.measured(sim_logger, fetcher.deliver)
+        logger.records_fetcher.deliver = self.on_records_delivered(sim_logger, logger.records_fetcher.deliver)
+        self.loggers.append(sim_logger)
+        self.by_nid[logger_id(i)] = sim_logger
+        self.tasks.append(aio.ensure_future(logger.flush_periodically()))
+        self.tasks.append(aio.ensure_future(logger.retry_fetches_periodically(5)))
+
+    # Wrap a fetcher's deliver to count the CPU time (and, with tracemalloc,
+    # the memory kept) for processing the logger's data.
+    def measured(self, sim_logger: SimLogger, deliver: Callable) -> Callable:
+        def measured_deliver(nid: str, seqno: int, content: bytes) -> None:
+            memory = tracemalloc.get_traced_memory()[0] if (self.args["tracemalloc"]) else 0
+            start = time.process_time()
+            try:
+                deliver(nid, seqno, content)
+            except Exception:
+                sim_logger.errors += 1
+                raise
+            finally:
+                sim_logger.cpu_seconds += time.process_time() - start
+                if (self.args["tracemalloc"]):
+                    sim_logger.memory_bytes += tracemalloc.get_traced_memory()[0] - memory
+        return measured_deliver
+
+    def on_records_delivered(self, sim_logger: SimLogger, deliver: Callable) -> Callable:
+        def records_delivered(nid: str, seqno: int, content: bytes) -> None:
+            deliver(nid, seqno, content)
+            if (not is_record_signature(content)):
+                self.add_holder(sim_logger, Record(data=content).get_record_id())
+        return records_delivered
+
+    def on_publish(self, svs: SimSVSync, seqno: int, data: bytes) -> None:
+        now = self.loop.time()
+        if (svs.nid_str == PRODUCER_ID):
+            self.events[Name.to_str(svs.getDataName(svs.nid, seqno))] = now
+            self.last_event_time = now
+            return
+        if (svs.group != RECORDS_GROUP or is_record_signature(data)):
+            return
+        record_id = Record(data=data).get_record_id()
+        event_time = self.events.get(Name.to_str(record_id.event_name))
+        sim_logger = self.by_nid[svs.nid_str]
+        if (event_time is not None):
+            sim_logger.create_latencies.append(now - event_time)
+        self.timings[record_id] = RecordTiming(
+            event_time, now, sum(1 for l in self.loggers if l.started <= now))
+        self.add_holder(sim_logger, record_id)
+
+    def add_holder(self, sim_logger: SimLogger, record_id: str) -> None:
+        if (record_id in sim_logger.records):
+            return
+        sim_logger.records.add(record_id)
+        timing = self.timings.get(record_id)
+        if (timing is None):
+            return
+        now = self.loop.time()
+        if (timing.created < now):
+            sim_logger.receive_latencies.append(now - timing.created)
+        if (sim_logger.started <= timing.created):
+            timing.required -= 1
+            if (timing.required == 0):
+                timing.committed = now
+
+    def converged(self) -> bool:
+        return all(len(l.records) == len(self.timings) and len(l.logger.orphan_index) == 0
+                   and l.logger.log_events_fetcher.delivered.get(PRODUCER_ID, 0) >= len(self.events)
+                   for l in self.loggers)
+
+    async def run(self) -> dict:
+        num_late = self.args["late_loggers"]
+        for i in range(self.args["loggers"] - num_late):
+            self.start_logger(i)
+        if (num_late):
+            self.loop.call_later(self.args["join_at"], lambda: [
+                self.start_logger(i) for i in range(self.args["loggers"] - num_late, self.args["loggers"])])
+        producer = Program({"interval": self.args["event_interval"] / 1000, "quiet": True},
+                           ndn_app=self.app, svs_class=SimSVSync)
+        producing = aio.ensure_future(producer.run(self.args["events"]))
+        convergence_time = None
+        while (self.loop.time() < self.args["max_time"]):
+            await aio.sleep(self.SAMPLE_INTERVAL)
+            for sim_logger in self.loggers:
+                sim_logger.orphan_samples.append(len(sim_logger.logger.orphan_index))
+            if (producing.done() and len(self.loggers) == self.args["loggers"] and self.converged()):
+                convergence_time = self.loop.time() - self.last_event_time
+                break
+        end_time = self.loop.time()
+        producing.cancel()
+        for task in self.tasks:
+            task.cancel()
+        # Stop the fetches still running.
+        pending = [task for task in aio.all_tasks() if task is not aio.current_task()]
+        for task in pending:
+            task.cancel()
+        await aio.gather(producing, *pending, return_exceptions=True)
+        return self.results(end_time, convergence_time)
+
+    def results(self, end_time: float, convergence_time: Optional[float]) -> dict:
+        committed = [t.committed - t.event_time for t in self.timings.values()
+                     if t.committed is not None and t.event_time is not None]
+        loggers = {}
+        for sim_logger in self.loggers:
+            logger = sim_logger.logger
+            samples = sim_logger.orphan_samples
+            loggers[logger_id(sim_logger.i)] = {
+                'started': sim_logger.started,
+                'records_created': len(sim_logger.create_latencies),
+                'records': len(sim_logger.records),
+                'create_latency': percentiles(sim_logger.create_latencies),
+                'receive_latency': percentiles(sim_logger.receive_latencies),
+                'orphans_max': max(samples) if samples else 0,
+                'orphans_mean': sum(samples) / len(samples) if samples else 0,
+                'orphans_left': len(logger.orphan_index),
+                'cpu_seconds': sim_logger.cpu_seconds,
+                'memory_kb': sim_logger.memory_bytes / 1024 if (self.args["tracemalloc"]) else None,
+                'store_kb': logger.record_storage.get_size_bytes() / 1024,
+                'errors': sim_logger.errors,
+            }
+        return {
+            'simulated_seconds': end_time,
+            'events': len(self.events),
+            'records': len(self.timings),
+            'records_committed': len(committed),
+            'commit_latency': percentiles(committed),
+            'converged': convergence_time is not None,
+            'convergence_time': convergence_time,
+            'packets_sent': self.network.packets_sent,
+            'packets_lost': self.network.packets_lost,
+            'loggers': loggers,
+        }
+
+    def close(self) -> None:
+        for sim_logger in self.loggers:
+            sim_logger.logger.close()
+
+def run_scenario(args: dict, workdir: str) -> dict:
+    random.seed(args["seed"])
+    loop = VirtualTimeLoop()
+    aio.set_event_loop(loop)
+    scenario = None
+    try:
+        scenario = Scenario(args, workdir)
+        return loop.run_until_complete(scenario.run())
+    finally:
+        if (scenario is not None):
+            scenario.close()
+        aio.set_event_loop(None)
+        loop.close()
+
+def ms(seconds: Optional[float]) -> str:
+    return f'{seconds * 1000:.0f}' if seconds is not None else '-'
+
+def print_results(results: dict) -> None:
+    latency = results['commit_latency']
+    print(f'{results["events"]} events, {results["records"]} records in {results["simulated_seconds"]:.1f} simulated seconds; '
+          f'{results["packets_lost"]} of {results["packets_sent"]} packets lost')
+    print(f'commit latency ms: p50 {ms(latency["p50"])}, p99 {ms(latency["p99"])}, max {ms(latency["max"])} '
+          f'({latency["count"]} of {results["records"]} records committed)')
+    if (results['converged']):
+        print(f'converged {results["convergence_time"]:.2f} s after the last event')
+    else:
+        print('did not converge')
+    print(f'{"logger":<12}{"created":>9}{"records":>9}{"create p50":>12}{"create p99":>12}{"recv p50":>10}{"recv p99":>10}'
+          f'{"orph max":>10}{"orph mean":>10}{"cpu s":>8}{"mem KB":>9}{"store KB":>10}{"errors":>8}')
+    for name, logger in results['loggers'].items():
+        memory = f'{logger["memory_kb"]:.0f}' if logger['memory_kb'] is not None else '-'
+        print(f'{name:<12}{logger["records_created"]:>9}{logger["records"]:>9}{ms(logger["create_latency"]["p50"]):>12}{ms(logger["create_latency"]["p99"]):>12}'
+              f'{ms(logger["receive_latency"]["p50"]):>10}{ms(logger["receive_latency"]["p99"]):>10}'
+              f'{logger["orphans_max"]:>10}{logger["orphans_mean"]:>10.1f}{logger["cpu_seconds"]:>8.2f}'
+              f'{memory:>9}{logger["store_kb"]:>10.0f}{logger["errors"]:>8}')
+
+def main() -> int:
+    args = parse_cmd_args()
+    workdir = tempfile.mkdtemp(prefix="mnemosyne_sim_")
+    if (args["tracemalloc"]):
+        tracemalloc.start()
+    try:
+        # The loggers print their own errors and start-up banners.
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = run_scenario(args, workdir)
+    finally:
+        if (args["tracemalloc"]):
+            tracemalloc.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+    print_results(results)
+    if (args["output"] is not None):
+        with open(args["output"], 'w') as f:
+            params = {k: v for k, v in args.items() if k != 'output'}
+            params["partitions"] = [(p.start, p.end, [sorted(g) for g in p.groups]) for p in params["partitions"]]
+            json.dump({'params': params, 'results': results}, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+import random
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+from ndn.encoding import FormalName, NonStrictName
+from record_id import RecordId
+
+class Tail:
+    __slots__ = ('name', 'name_str', 'record_hash', 'producer')
+
+    def __init__(self, name: NonStrictName, record_hash: str, producer: str) -> None:
+        # The tail's RecordId, which is also its name as a string.
+        self.name_str: RecordId = RecordId.from_name(name)
+        self.name: FormalName = self.name_str.name
+        self.record_hash = record_hash
+        self.producer = producer
+
+# The DAG's tails: validated records that no validated record points to yet,
+# i.e. the records new records should point to.
+# Records are added once they are validated and removed once a record points
+# to them, so the index never has to be rebuilt. Each tail is indexed at once
+# as a list slot (for random picks; removal swaps in the last slot), in age
+# order, and per producer, so adding, removing and selecting tails take
+# constant time.
+# select() picks tails with one of the POLICIES:
+# - 'random': any tail.
+# - 'oldest': the oldest tails first. Merges old branches, keeping the DAG narrow.
+# - 'cross-logger': the oldest tails of other loggers, a different logger for
+#   each pick where possible. Links the loggers' histories to each other.
+# At most max_tails tails are kept; the oldest is dropped when full.
+class TailIndex:
+    POLICIES = {
+        'random': 'select_random',
+        'oldest': 'select_oldest',
+        'cross-logger': 'select_cross_logger',
+    }
+
+    def __init__(self, policy: str = 'random', max_tails: int = 1024,
+                 own_producer: Optional[str] = None) -> None:
+        if (policy not in self.POLICIES):
+            raise RuntimeError('Unknown tail selection policy: ' + policy)
+        self.select_tails = getattr(self, self.POLICIES[policy])
+        self.max_tails = max_tails
+        # Tails of this producer are avoided by the cross-logger policy.
+        self.own_producer = own_producer
+        self.tails: List[Tail] = []
+        self.positions: Dict[str, int] = {}
+        # Oldest first.
+        self.by_age: OrderedDict = OrderedDict()
+        # {producer: its tails, oldest first}, and the producers as a list
+        # (with their positions in it) for random picks.
+        self.by_producer: Dict[str, OrderedDict] = {}
+        self.producers: List[str] = []
+        self.producer_positions: Dict[str, int] = {}
+        self.num_added: int = 0
+        self.num_removed: int = 0
+        self.num_dropped: int = 0
+
+    def __len__(self) -> int:
+        return len(self.tails)
+
+    def __contains__(self, name_str: str) -> bool:
+        return name_str in self.positions
+
+    def add(self, name: NonStrictName, record_hash: str, producer: str) -> None:
+        tail = Tail(name, record_hash, producer)
+        if (tail.name_str in self.positions):
+            return
+        self.positions[tail.name_str] = len(self.tails)
+        self.tails.append(tail)
+        self.by_age[tail.name_str] = tail
+        if (producer not in self.by_producer):
+            self.by_producer[producer] = OrderedDict()
+            self.producer_positions[producer] = len(self.producers)
+            self.producers.append(producer)
+        self.by_producer[producer][tail.name_str] = tail
+        self.num_added += 1
+        while (len(self.tails) > self.max_tails):
+            self.discard(next(iter(self.by_age)))
+            self.num_dropped += 1
+
+    # A record now points to this tail. Returns whether it was a tail.
+    def remove(self, name_str: str) -> bool:
+        if (name_str not in self.positions):
+            return False
+        self.discard(name_str)
+        self.num_removed += 1
+        return True
+
+    def discard(self, name_str: str) -> None:
+        position = self.positions.pop(name_str)
+        last = self.tails.pop()
+        if (last.name_str != name_str):
+            self.tails[position] = last
+            self.positions[last.name_str] = position
+        tail = self.by_age.pop(name_str)
+        producer_tails = self.by_producer[tail.producer]
+        del producer_tails[name_str]
+        if (not producer_tails):
+            del self.by_producer[tail.producer]
+            position = self.producer_positions.pop(tail.producer)
+            last_producer = self.producers.pop()
+            if (last_producer != tail.producer):
+                self.producers[position] = last_producer
+                self.producer_positions[last_producer] = position
+
+    # Pick up to count tails, other than the ones named in exclude.
+    def select(self, count: int, exclude: Set[str] = frozenset()) -> List[Tail]:
+        if (count <= 0):
+            return []
+        return self.select_tails(count, exclude)
+
+    def select_random(self, count: int, exclude: Set[str]) -> List[Tail]:
+        selected: List[Tail] = []
+        names = set(exclude)
+        if (len(self.tails) <= count + len(exclude)):
+            candidates = [tail for tail in self.tails if tail.name_str not in names]
+            random.shuffle(candidates)
+            return candidates[:count]
+        while (len(selected) < count):
+            tail = self.tails[random.randrange(len(self.tails))]
+            if (tail.name_str not in names):
+                names.add(tail.name_str)
+                selected.append(tail)
+        return selected
+
+    def select_oldest(self, count: int, exclude: Set[str]) -> List[Tail]:
+        selected: List[Tail] = []
+        for tail in self.by_age.values():
+            if (len(selected) >= count):
+                break
+            if (tail.name_str not in exclude):
+                selected.append(tail)
+        return selected
+
+    def select_cross_logger(self, count: int, exclude: Set[str]) -> List[Tail]:
+        selected: List[Tail] = []
+        names = set(exclude)
+        producers = [p for p in self.pick_producers(count + len(exclude) + 1)
+                     if p != self.own_producer]
+        for producer in producers:
+            if (len(selected) >= count):
+                break
+            for tail in self.by_producer[producer].values():
+                if (tail.name_str not in names):
+                    names.add(tail.name_str)
+                    selected.append(tail)
+                    break
+        if (len(selected) < count):
+            selected += self.select_oldest(count - len(selected), names)
+        return selected
+
+    # Up to count different producers that have tails, chosen at random.
+    def pick_producers(self, count: int) -> List[str]:
+        if (len(self.producers) <= count):
+            producers = list(self.producers)
+            random.shuffle(producers)
+            return producers
+        picked: Set[str] = set()
+        while (len(picked) < count):
+            picked.add(self.producers[random.randrange(len(self.producers))])
+        return list(picked)
+
+    # The newest tails, newest first.
+    def newest(self, count: int) -> List[Tail]:
+        tails: List[Tail] = []
+        for tail in reversed(self.by_age.values()):
+            if (len(tails) >= count):
+                break
+            tails.append(tail)
+        return tails
+
+    def get_stats(self) -> dict:
+        return {
+            'tails': len(self.tails),
+            'producers': len(self.producers),
+            'added': self.num_added,
+            'removed': self.num_removed,
+            'dropped': self.num_dropped,
+        }
@@ -0,0 +1,50 @@
+import dbm
+from collections import OrderedDict
+
+# Records that have already been verified back to the genesis records.
+# Stored as {Name (str): record hash (str)}.
+# Every entry is written to a dbm file next to the record store so the verified
+# set survives restarts. The most recently used entries are also kept in memory,
+# up to max_entries; older ones are evicted from memory and read back from disk
+# when needed.
+class ValidationCache:
+    def __init__(self, db_name: str = 'validation_cache', max_entries: int = 65536):
+        self.db_name = db_name
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()
+        self.db = None
+
+    def get_db(self):
+        if (self.db is None):
+            self.db = dbm.open(self.db_name, 'c')
+        return self.db
+
+    # Remember a record in memory, evicting the least recently used one if full.
+    def remember(self, record_name: str, record_hash: str) -> None:
+        self.entries[record_name] = record_hash
+        self.entries.move_to_end(record_name)
+        while (len(self.entries) > self.max_entries):
+            self.entries.popitem(last=False)
+
+    # True if the record was verified before with exactly this hash.
+    def is_valid(self, record_name: str, record_hash: str) -> bool:
+        cached_hash = self.entries.get(record_name)
+        if (cached_hash is None):
+            db = self.get_db()
+            if (record_name not in db):
+                return False
+            cached_hash = db[record_name].decode()
+            self.remember(record_name, cached_hash)
+        else:
+            self.entries.move_to_end(record_name)
+        return cached_hash == record_hash
+
+    # Mark a record as verified.
+    def add(self, record_name: str, record_hash: str) -> None:
+        self.remember(record_name, record_hash)
+        self.get_db()[record_name] = record_hash.encode()
+
+    def close(self) -> None:
+        if (self.db is not None):
+            self.db.close()
+            self.db = None